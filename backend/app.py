@@ -1,9 +1,12 @@
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, jsonify, request, send_file
 from flask_cors import CORS
 from routes.compression_routes import compression_bp
 from routes.conversion_routes import conversion_bp
+from routes.estimate_routes import estimate_bp
+from routes.job_routes import job_bp
+from routes.upload_routes import upload_bp
 from config.settings import Config
-from PIL import Image
+from utils import metrics, warmup
 import io
 import os
 from datetime import datetime
@@ -16,6 +19,9 @@ def create_app():
     # Register blueprints
     app.register_blueprint(compression_bp)
     app.register_blueprint(conversion_bp, url_prefix='/api/convert')
+    app.register_blueprint(estimate_bp, url_prefix='/api/estimate')
+    app.register_blueprint(job_bp, url_prefix='/api/jobs')
+    app.register_blueprint(upload_bp, url_prefix='/api/uploads')
     
     # Root route
     @app.route('/')
@@ -25,8 +31,13 @@ def create_app():
             'message': 'Yukomp API is running',
             'endpoints': {
                 'image_compression': '/api/compress/image',
+                'image_variants': '/api/compress/image/variants',
                 'pdf_compression': '/api/compress/pdf',
-                'jpg_to_pdf': '/api/convert/jpg-to-pdf'
+                'jpg_to_pdf': '/api/convert/jpg-to-pdf',
+                'size_estimate': '/api/estimate/<image|pdf>',
+                'jobs': '/api/jobs/<image|pdf|jpg-to-pdf>',
+                'chunked_uploads': '/api/uploads',
+                'metrics': '/api/metrics'
             }
         })
     
@@ -34,7 +45,15 @@ def create_app():
     def health_check():
         if request.method == 'OPTIONS':
             return '', 200
-        return jsonify({"status": "healthy"}), 200
+        return jsonify({
+            "status": "healthy",
+            "worker": {"pid": os.getpid(), "ready": warmup.status()['ready']}
+        }), 200
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics_endpoint():
+        # Prometheus text exposition format
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
     @app.route('/api/db-health', methods=['GET', 'OPTIONS'])
     def db_health_check():
@@ -52,9 +71,12 @@ def create_app():
         if request.method == 'OPTIONS':
             return '', 200
         try:
-            # Add your file service check here
-            # For now, we'll just return healthy
-            return jsonify({"status": "healthy"}), 200
+            # Ready once this worker has loaded Pillow and PyMuPDF
+            state = warmup.status()
+            worker = {"pid": os.getpid(), "warm_up_seconds": state['seconds']}
+            if not state['ready']:
+                return jsonify({"status": "unhealthy", "error": state['error'] or "warming up", "worker": worker}), 503
+            return jsonify({"status": "healthy", "worker": worker}), 200
         except Exception as e:
             return jsonify({"status": "unhealthy", "error": str(e)}), 500
 
@@ -76,5 +98,9 @@ def create_app():
     return app
 
 if __name__ == '__main__':
+    if Config.WARM_UP == 'preload':
+        warmup.warm_up()
+    elif Config.WARM_UP == 'background':
+        warmup.start_background()
     app = create_app()
     app.run(debug=True, port=5000)
\ No newline at end of file
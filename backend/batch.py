@@ -0,0 +1,261 @@
+"""Compress a directory tree or a manifest of files without going through HTTP.
+
+Files are compressed on a process pool and written either next to their
+inputs (as compressed_<name>) or to the same relative path under --output.
+Progress is recorded per file in a SQLite state file, so an interrupted run
+picks up where it stopped and unchanged files are skipped on later runs.
+
+Usage (from backend/):
+    python batch.py /data/scans --output /data/scans-compressed
+    python batch.py /data --manifest nightly.txt --workers 8 --profile screen
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import tempfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from config.settings import Config
+from utils.file_utils import allowed_file
+
+STATE_FILE = '.yukomp-batch.sqlite3'
+OUTPUT_PREFIX = 'compressed_'
+
+def file_kind(path):
+    """Return 'image', 'pdf' or None for a path"""
+    name = os.path.basename(path)
+    if allowed_file(name, Config.ALLOWED_IMAGE_EXTENSIONS):
+        return 'image'
+    if allowed_file(name, Config.ALLOWED_PDF_EXTENSIONS):
+        return 'pdf'
+    return None
+
+def iter_inputs(source, manifest=None, output_dir=None):
+    """Yield input paths relative to source, from a manifest or by walking the tree.
+
+    Manifest entries are only normalized here, main() rejects the ones outside source
+    """
+    if manifest:
+        with open(manifest) as manifest_file:
+            for line in manifest_file:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield os.path.normpath(line)
+        return
+
+    for directory, dirnames, filenames in os.walk(source):
+        # An output tree under source holds the previous run's outputs, not inputs
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if not name.startswith('.') and os.path.join(directory, name) != output_dir
+        )
+        for name in sorted(filenames):
+            # Outputs written next to their inputs are not inputs themselves
+            if not name.startswith(OUTPUT_PREFIX) and file_kind(name):
+                yield os.path.relpath(os.path.join(directory, name), source)
+
+def is_inside(relative_path):
+    """Whether a normalized relative path stays inside the directory it is relative to"""
+    return not (os.path.isabs(relative_path) or relative_path == os.pardir
+                or relative_path.startswith(os.pardir + os.sep))
+
+def output_path(source, relative_path, output_dir=None):
+    if output_dir:
+        return os.path.join(output_dir, relative_path)
+    directory, name = os.path.split(os.path.join(source, relative_path))
+    return os.path.join(directory, OUTPUT_PREFIX + name)
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def open_state(path):
+    connection = sqlite3.connect(path)
+    connection.row_factory = sqlite3.Row
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT,
+            params TEXT NOT NULL,
+            output TEXT,
+            output_size INTEGER,
+            status TEXT NOT NULL,
+            error TEXT,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    return connection
+
+def is_up_to_date(record, stat, path, params):
+    """Whether a previous run already compressed this exact file with these parameters"""
+    if record is None or record['status'] != 'done' or record['params'] != params:
+        return False
+    if not record['output'] or not os.path.exists(record['output']) or record['size'] != stat.st_size:
+        return False
+    # Same size and mtime is trusted, a touched file is compared by content
+    return record['mtime_ns'] == stat.st_mtime_ns or sha256_file(path) == record['sha256']
+
+def init_worker():
+    """Pool initializer: no nested pools, and no result cache for one-off files"""
+    from utils import worker_pool
+    worker_pool._mark_worker()
+    Config.RESULT_CACHE_MEMORY_BYTES = 0
+    Config.RESULT_CACHE_DISK_BYTES = 0
+
+def compress_file(kind, input_path, destination, options):
+    """Worker entry point, returns (sha256, input bytes, output bytes)"""
+    from werkzeug.datastructures import FileStorage
+    from services.image_compression_service import ImageCompressionService
+    from services.pdf_compression_service import PdfCompressionService
+
+    digest = sha256_file(input_path)
+    with open(input_path, 'rb') as input_file:
+        file = FileStorage(stream=input_file, filename=os.path.basename(input_path))
+        if kind == 'pdf':
+            output = PdfCompressionService.compress_pdf(file, profile=options['profile'])
+        else:
+            output = ImageCompressionService.compress_image(file, effort=options['effort'])
+        input_size = file.seek(0, os.SEEK_END)
+
+    # Write then rename so an interrupted run never leaves a partial output
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination) or '.', prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output_file:
+            output_file.write(output.getbuffer())
+        os.replace(temp_path, destination)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return digest, input_size, output.getbuffer().nbytes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('source', help='Directory to walk, or the base for relative manifest paths')
+    parser.add_argument('--manifest', help='File listing the inputs to process, one path per line')
+    parser.add_argument('--output', help='Mirror tree for outputs (default: compressed_<name> next to each input)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--profile', default=Config.PDF_DEFAULT_PROFILE, choices=sorted(Config.PDF_PROFILES), help='PDF profile')
+    parser.add_argument('--effort', default=Config.PNG_DEFAULT_EFFORT, choices=sorted(Config.PNG_EFFORT_LEVELS), help='PNG zlib effort')
+    parser.add_argument('--state', help=f'Progress file (default: {STATE_FILE} in the output or source directory)')
+    parser.add_argument('--quiet', action='store_true', help='Only print the summary')
+    args = parser.parse_args()
+
+    source = os.path.abspath(args.source)
+    output_dir = os.path.abspath(args.output) if args.output else None
+    if output_dir == source:
+        parser.error('--output must differ from source, outputs would replace their inputs')
+    options = {'profile': args.profile, 'effort': args.effort}
+    params = json.dumps({
+        **options,
+        'pdf_profile': Config.PDF_PROFILES[args.profile],
+        'png_levels': Config.PNG_EFFORT_LEVELS[args.effort],
+    }, sort_keys=True)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    state = open_state(args.state or os.path.join(output_dir or source, STATE_FILE))
+
+    totals = {'done': 0, 'skipped': 0, 'failed': 0, 'input_bytes': 0, 'output_bytes': 0}
+    started = time.perf_counter()
+
+    def record(relative_path, stat, **fields):
+        fields.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns, params=params, updated_at=time.time())
+        columns = ', '.join(fields)
+        with state:
+            state.execute(
+                f'INSERT OR REPLACE INTO files (path, {columns}) VALUES (?, {", ".join("?" for _ in fields)})',
+                (relative_path, *fields.values())
+            )
+
+    def finish(future):
+        relative_path, stat, destination = pending.pop(future)
+        try:
+            digest, input_size, output_size = future.result()
+        except Exception as e:
+            totals['failed'] += 1
+            record(relative_path, stat, status='failed', error=str(e))
+            print(f'FAILED {relative_path}: {e}', file=sys.stderr)
+            return
+        totals['done'] += 1
+        totals['input_bytes'] += input_size
+        totals['output_bytes'] += output_size
+        record(relative_path, stat, sha256=digest, output=destination, output_size=output_size, status='done', error=None)
+        if not args.quiet:
+            print(f'{relative_path}: {input_size / 1024:.0f} KB -> {output_size / 1024:.0f} KB')
+
+    workers = max(1, args.workers)
+    pending = {}
+    interrupted = False
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        try:
+            for relative_path in iter_inputs(source, args.manifest, output_dir):
+                # A manifest entry outside source would have its output written outside
+                # --output, possibly over another input
+                if not is_inside(relative_path):
+                    totals['failed'] += 1
+                    print(f'FAILED {relative_path}: outside {source}', file=sys.stderr)
+                    continue
+                path = os.path.join(source, relative_path)
+                kind = file_kind(path)
+                try:
+                    stat = os.stat(path)
+                except OSError as e:
+                    totals['failed'] += 1
+                    print(f'FAILED {relative_path}: {e}', file=sys.stderr)
+                    continue
+                if kind is None:
+                    continue
+
+                previous = state.execute('SELECT * FROM files WHERE path = ?', (relative_path,)).fetchone()
+                if is_up_to_date(previous, stat, path, params):
+                    totals['skipped'] += 1
+                    if previous['mtime_ns'] != stat.st_mtime_ns:
+                        record(relative_path, stat, sha256=previous['sha256'], output=previous['output'],
+                               output_size=previous['output_size'], status='done', error=None)
+                    continue
+
+                destination = output_path(source, relative_path, output_dir)
+                future = executor.submit(compress_file, kind, path, destination, options)
+                pending[future] = (relative_path, stat, destination)
+
+                # Keep a bounded window of submitted files so huge trees are not queued at once
+                while len(pending) >= workers * 2:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future)
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(future)
+        except KeyboardInterrupt:
+            # Finished files are already recorded, the next run resumes from here
+            interrupted = True
+            for future in pending:
+                future.cancel()
+
+    elapsed = time.perf_counter() - started
+    input_mb = totals['input_bytes'] / (1024 * 1024)
+    output_mb = totals['output_bytes'] / (1024 * 1024)
+    saved = (1 - totals['output_bytes'] / totals['input_bytes']) * 100 if totals['input_bytes'] else 0
+    print(
+        f"{'Interrupted' if interrupted else 'Finished'} in {elapsed:.1f}s: "
+        f"{totals['done']} compressed, {totals['skipped']} up to date, {totals['failed']} failed"
+    )
+    print(
+        f"{input_mb:.1f} MB -> {output_mb:.1f} MB ({saved:.1f}% saved), "
+        f"{totals['done'] / elapsed if elapsed else 0:.1f} files/s, {input_mb / elapsed if elapsed else 0:.1f} MB/s"
+    )
+    state.close()
+    return 1 if totals['failed'] or interrupted else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""Deterministic synthetic corpus for the benchmarks.
+
+Every file is generated from fixed parameters, so the same corpus comes
+out on every machine. Files are written once and reused.
+"""
+import os
+from io import BytesIO
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.corpus')
+
+def synthetic_photo(size, seed=0):
+    """Deterministic photo-like RGB image with fine detail and smooth gradients"""
+    # Shift the fractal window per seed so images differ but stay reproducible
+    offset = seed * 0.05
+    detail = Image.effect_mandelbrot(size, (-2.0 + offset, -1.2, 1.0 + offset, 1.2), 100)
+    gradient = Image.linear_gradient('L').resize(size)
+    radial = Image.radial_gradient('L').resize(size)
+    return Image.merge('RGB', (detail, gradient, radial))
+
+def synthetic_graphic(size, seed=0):
+    """Deterministic flat-colour graphic, the kind of image PNG is used for"""
+    image = Image.new('RGB', size, (255, 255, 255))
+    draw = ImageDraw.Draw(image)
+    width, height = size
+    for index in range(24):
+        step = index + seed * 7
+        color = ((step * 53) % 256, (step * 97) % 256, (step * 151) % 256)
+        left = (step * 37) % width
+        top = (step * 61) % height
+        draw.rectangle((left, top, left + width // 5, top + height // 7), fill=color)
+        draw.ellipse((top % width, left % height, top % width + width // 6, left % height + height // 6), outline=(0, 0, 0), width=3)
+    return image
+
+def _image_bytes(image, output_format, **params):
+    buffer = BytesIO()
+    image.save(buffer, format=output_format, **params)
+    return buffer.getvalue()
+
+def _write_pdf(path, pages, shared_image=True, unique_images=True):
+    """Write a multi-page PDF with an optional shared logo and per-page photos"""
+    doc = fitz.open()
+    logo = _image_bytes(synthetic_graphic((300, 300), seed=99), 'PNG')
+    for page_num in range(pages):
+        page = doc.new_page()
+        if shared_image:
+            page.insert_image(fitz.Rect(36, 36, 136, 136), stream=logo)
+        if unique_images:
+            photo = _image_bytes(synthetic_photo((1600, 1200), seed=page_num), 'JPEG', quality=95)
+            page.insert_image(fitz.Rect(36, 160, 576, 565), stream=photo)
+        page.insert_text((36, 700), f'Benchmark page {page_num + 1}', fontsize=14)
+    doc.set_metadata({})
+    doc.save(path, garbage=1, deflate=True, no_new_id=True)
+    doc.close()
+
+def _palette_with_transparency(size):
+    image = synthetic_graphic(size, seed=3).quantize(colors=64)
+    image.info['transparency'] = 0
+    return image
+
+def _rgba(size):
+    image = synthetic_photo(size, seed=4).convert('RGBA')
+    image.putalpha(Image.radial_gradient('L').resize(size))
+    return image
+
+def _gray_alpha(size):
+    image = synthetic_photo(size, seed=8).convert('L')
+    return Image.merge('LA', (image, Image.linear_gradient('L').resize(size)))
+
+def _gray16(size):
+    # Spread the 8-bit values over the full 16-bit range
+    image = synthetic_photo(size, seed=9).convert('L').convert('I')
+    return image.point(lambda value: value * 257).convert('I;16')
+
+# name -> function writing the file to a path
+FILES = {
+    'jpeg_small.jpg': lambda path: synthetic_photo((640, 480), 1).save(path, quality=90),
+    'jpeg_medium.jpg': lambda path: synthetic_photo((1920, 1080), 2).save(path, quality=92),
+    'jpeg_large.jpg': lambda path: synthetic_photo((4000, 3000), 3).save(path, quality=95),
+    'png_rgb.png': lambda path: synthetic_photo((1600, 1200), 5).save(path),
+    'png_graphic.png': lambda path: synthetic_graphic((1600, 1200), 6).save(path),
+    'png_rgba.png': lambda path: _rgba((1200, 900)).save(path),
+    'png_palette.png': lambda path: _palette_with_transparency((800, 600)).save(path),
+    'png_gray.png': lambda path: synthetic_photo((1600, 1200), 7).convert('L').save(path),
+    'png_la.png': lambda path: _gray_alpha((1200, 900)).save(path),
+    'png_gray16.png': lambda path: _gray16((1200, 900)).save(path),
+    'jpeg_cmyk.jpg': lambda path: synthetic_photo((1600, 1200), 10).convert('CMYK').save(path, quality=92),
+    'pdf_shared.pdf': lambda path: _write_pdf(path, 40, shared_image=True, unique_images=False),
+    'pdf_unique.pdf': lambda path: _write_pdf(path, 10, shared_image=False, unique_images=True),
+    'pdf_mixed.pdf': lambda path: _write_pdf(path, 20, shared_image=True, unique_images=True),
+}
+
+def ensure_corpus(directory=DEFAULT_DIR):
+    """Generate any missing corpus files and return the corpus directory"""
+    os.makedirs(directory, exist_ok=True)
+    for name, write in FILES.items():
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            write(path)
+    return directory
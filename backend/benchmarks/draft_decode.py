@@ -0,0 +1,81 @@
+"""Compare full-resolution decode + LANCZOS against reduced decode paths.
+
+Checks that DCT-domain JPEG decoding (Image.draft) and reducing_gap resizes
+stay within a PSNR tolerance of the full-quality path, and reports timings.
+
+Usage (from backend/):
+    python -m benchmarks.draft_decode [--min-psnr 35]
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from io import BytesIO
+from PIL import Image, ImageChops, ImageStat
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.corpus import synthetic_photo
+from config.settings import Config
+from services.pdf_conversion_service import PdfConversionService
+
+SIZES = [(2000, 1500), (4000, 3000), (6000, 4000)]
+
+def psnr(reference, candidate):
+    """Peak signal-to-noise ratio in dB between two RGB images"""
+    rms = ImageStat.Stat(ImageChops.difference(reference, candidate)).rms
+    mse = sum(value ** 2 for value in rms) / len(rms)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+def full_decode(data, size):
+    image = Image.open(BytesIO(data)).convert('RGB')
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+def reduced_decode(data, size):
+    image = Image.open(BytesIO(data))
+    image.draft(image.mode, size)
+    image = image.convert('RGB')
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=Config.RESIZE_REDUCING_GAP)
+
+def run(min_psnr):
+    target_width = PdfConversionService.STANDARD_WIDTH - 2 * PdfConversionService.MARGIN
+    results = []
+    for size in SIZES:
+        buffer = BytesIO()
+        synthetic_photo(size).save(buffer, format='JPEG', quality=90)
+        data = buffer.getvalue()
+        target = (target_width, int(target_width * size[1] / size[0]))
+
+        reference, full_seconds = timed(lambda: full_decode(data, target))
+        candidate, reduced_seconds = timed(lambda: reduced_decode(data, target))
+        quality = psnr(reference, candidate)
+
+        results.append({
+            'source': f'{size[0]}x{size[1]}',
+            'target': f'{target[0]}x{target[1]}',
+            'full_seconds': round(full_seconds, 4),
+            'reduced_seconds': round(reduced_seconds, 4),
+            'speedup': round(full_seconds / reduced_seconds, 2),
+            'psnr_db': round(quality, 2) if math.isfinite(quality) else None,  # None means identical
+            'ok': quality >= min_psnr,
+        })
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--min-psnr', type=float, default=35.0, help='Minimum PSNR in dB against the full-decode path')
+    args = parser.parse_args()
+
+    results = run(args.min_psnr)
+    print(json.dumps(results, indent=2))
+    return 0 if all(result['ok'] for result in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
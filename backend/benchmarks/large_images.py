@@ -0,0 +1,118 @@
+"""Peak memory of very large images, tiled against in-memory processing.
+
+Each input is compressed and converted to PDF in a fresh subprocess, once
+with IMAGE_TILED_MIN_PIXELS at 0 (every image in strips, except JPEG
+compression of JPEGs, which keeps whole-image encodes) and once with it
+out of reach (every image decoded and processed whole). Peak RSS is
+reported above the process's own after imports and reading the input, so
+with tiling it should stay flat as the pixel count grows.
+
+Usage (from backend/):
+    python -m benchmarks.large_images [--sizes 4000x3000,8000x6000] [--output report.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.corpus import DEFAULT_DIR, synthetic_photo, _rgba
+
+SIZES = [(4000, 3000), (6000, 4500), (8000, 6000), (10000, 7500)]
+TARGETS = ['image', 'jpg-to-pdf']
+MODES = {'tiled': '0', 'in_memory': str(10 ** 15)}
+
+# kind -> (file extension, function writing an image of size to a path)
+KINDS = {
+    'jpeg': ('jpg', lambda size, path: synthetic_photo(size, 11).save(path, quality=90)),
+    'png_rgba': ('png', lambda size, path: _rgba(size).save(path, compress_level=1)),
+}
+
+def ensure_inputs(directory, sizes):
+    """Generate missing inputs and return their paths, smallest first"""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for width, height in sizes:
+        for kind, (extension, write) in KINDS.items():
+            path = os.path.join(directory, f'{kind}_{width}x{height}.{extension}')
+            if not os.path.exists(path):
+                write((width, height), path)
+            paths.append(path)
+    return paths
+
+def probe(target, path):
+    """Process one input in this process and return its metrics"""
+    import logging
+    logging.disable(logging.INFO)
+    from benchmarks.run import _execute, _peak_rss_mb
+
+    with open(path, 'rb') as input_file:
+        data = input_file.read()
+    import app  # noqa: F401
+    from utils import warmup
+    warmup.warm_up()
+    baseline_rss = _peak_rss_mb()
+
+    start = time.perf_counter()
+    output = _execute(target, [(os.path.basename(path), data)])
+    return {
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_delta_mb': round(_peak_rss_mb() - baseline_rss, 1),
+        'output_bytes': len(output),
+    }
+
+def run(paths):
+    results = []
+    for path in paths:
+        for target in TARGETS:
+            row = {'input': os.path.basename(path), 'target': target}
+            for mode, threshold in MODES.items():
+                env = dict(
+                    os.environ,
+                    IMAGE_TILED_MIN_PIXELS=threshold,
+                    RESULT_CACHE_MEMORY_BYTES='0',
+                    RESULT_CACHE_DISK_BYTES='0',
+                    COMPRESSION_MAX_WORKERS='1',
+                )
+                completed = subprocess.run(
+                    [sys.executable, '-m', 'benchmarks.large_images', '--probe', target, path],
+                    cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+                )
+                if completed.returncode != 0:
+                    row[mode] = {'error': completed.stderr.strip().splitlines()[-1:]}
+                else:
+                    row[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+            print(f"{row['input']} {target}: {row['tiled']} / {row['in_memory']}", file=sys.stderr)
+            results.append(row)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=os.path.join(DEFAULT_DIR, 'large'), help='Directory for the generated inputs')
+    parser.add_argument('--sizes', help='Comma-separated WIDTHxHEIGHT list, defaults to 12 to 75 megapixels')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--probe', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        print(json.dumps(probe(*args.probe)))
+        return 0
+
+    sizes = SIZES
+    if args.sizes:
+        sizes = [tuple(int(value) for value in size.split('x')) for size in args.sizes.split(',')]
+    results = run(ensure_inputs(args.corpus, sizes))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+    return 1 if any('error' in row[mode] for row in results for mode in MODES) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+"""Benchmark suite for the image, PDF and conversion paths.
+
+Each case runs in a fresh subprocess so peak RSS is measured per case, and
+the startup case times a fresh interpreter up to its first health response.
+The result cache is disabled and the worker pool is sized by --workers
+(1 by default, so CPU time is measured in-process).
+
+Usage (from backend/):
+    python -m benchmarks.run --output benchmarks/results/current.json
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+from io import BytesIO
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# name -> (target, corpus files)
+# Targets starting with / are Flask routes, 'startup' is the cold start probe,
+# the rest are service entry points
+CASES = {
+    'startup.health': ('startup', []),
+    'image.jpeg_small': ('image', ['jpeg_small.jpg']),
+    'image.jpeg_medium': ('image', ['jpeg_medium.jpg']),
+    'image.jpeg_large': ('image', ['jpeg_large.jpg']),
+    'image.png_rgb': ('image', ['png_rgb.png']),
+    'image.png_graphic': ('image', ['png_graphic.png']),
+    'image.png_rgba': ('image', ['png_rgba.png']),
+    'image.png_palette': ('image', ['png_palette.png']),
+    'image.png_gray': ('image', ['png_gray.png']),
+    'image.png_la': ('image', ['png_la.png']),
+    'image.png_gray16': ('image', ['png_gray16.png']),
+    'image.jpeg_cmyk': ('image', ['jpeg_cmyk.jpg']),
+    'pdf.shared': ('pdf', ['pdf_shared.pdf']),
+    'pdf.unique': ('pdf', ['pdf_unique.pdf']),
+    'pdf.mixed': ('pdf', ['pdf_mixed.pdf']),
+    'convert.jpg_to_pdf': ('jpg-to-pdf', ['jpeg_small.jpg', 'jpeg_medium.jpg', 'jpeg_large.jpg', 'png_rgba.png']),
+    'convert.mixed_modes': ('jpg-to-pdf', ['png_rgba.png', 'png_la.png', 'png_palette.png', 'png_gray16.png', 'jpeg_cmyk.jpg']),
+    'route.image_single': ('/api/compress/image', ['jpeg_medium.jpg']),
+    'route.image_batch': ('/api/compress/image', ['jpeg_small.jpg', 'jpeg_medium.jpg', 'png_rgb.png', 'png_palette.png']),
+    'route.image_variants': ('/api/compress/image/variants', ['jpeg_large.jpg']),
+    'route.pdf_single': ('/api/compress/pdf', ['pdf_mixed.pdf']),
+    'route.pdf_batch': ('/api/compress/pdf', ['pdf_shared.pdf', 'pdf_unique.pdf']),
+    'route.jpg_to_pdf': ('/api/convert/jpg-to-pdf', ['jpeg_small.jpg', 'jpeg_medium.jpg', 'png_gray.png']),
+}
+
+# Metrics compared against a baseline, with the noise floor below which differences are ignored
+COMPARED_METRICS = {
+    'wall_seconds': 0.005,
+    'cpu_seconds': 0.005,
+    'peak_rss_mb': 2.0,
+    'output_bytes': 0,
+}
+
+def _peak_rss_mb():
+    # On Linux ru_maxrss survives fork/exec from the parent, VmHWM starts fresh
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _input_megapixels(inputs):
+    """Decoded pixels of the inputs, counting the images embedded in PDFs"""
+    import fitz  # PyMuPDF
+    from PIL import Image
+
+    pixels = 0
+    for name, data in inputs:
+        if name.endswith('.pdf'):
+            with fitz.open(stream=data, filetype='pdf') as doc:
+                images = {img[0]: img[2] * img[3] for page in doc for img in page.get_images()}
+            pixels += sum(images.values())
+        else:
+            width, height = Image.open(BytesIO(data)).size
+            pixels += width * height
+    return pixels / 1_000_000
+
+def _execute(target, inputs):
+    """Run one case and return the output bytes"""
+    from werkzeug.datastructures import FileStorage
+
+    if target.startswith('/'):
+        from app import create_app
+        client = create_app().test_client()
+        response = client.post(
+            target,
+            data={'files': [(BytesIO(data), name) for name, data in inputs]},
+            content_type='multipart/form-data'
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f'{target} returned {response.status_code}')
+        return response.get_data()
+
+    files = [FileStorage(stream=BytesIO(data), filename=name) for name, data in inputs]
+    if target == 'image':
+        from services.image_compression_service import ImageCompressionService
+        return ImageCompressionService.compress_image(files[0]).getvalue()
+    if target == 'pdf':
+        from services.pdf_compression_service import PdfCompressionService
+        return PdfCompressionService.compress_pdf(files[0]).getvalue()
+    if target == 'jpg-to-pdf':
+        from services.pdf_conversion_service import PdfConversionService
+        return PdfConversionService.images_to_pdf(files).getvalue()
+    raise ValueError(f'Unknown benchmark target: {target}')
+
+def _startup(repeat):
+    """Run the cold start probe in repeat fresh interpreters, returning the best run"""
+    runs = []
+    for _ in range(repeat):
+        process_start = time.perf_counter()
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.startup'],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        # Includes interpreter start, which the probe cannot see
+        probe['process_seconds'] = round(time.perf_counter() - process_start, 4)
+        runs.append(probe)
+    return min(runs, key=lambda probe: probe['wall_seconds'])
+
+def run_case(name, corpus_dir, repeat):
+    """Run a case in this process, returning its metrics (best of repeat runs)"""
+    import logging
+    logging.disable(logging.INFO)
+
+    target, file_names = CASES[name]
+    if target == 'startup':
+        return _startup(repeat)
+
+    inputs = []
+    for file_name in file_names:
+        with open(os.path.join(corpus_dir, file_name), 'rb') as input_file:
+            inputs.append((file_name, input_file.read()))
+    input_bytes = sum(len(data) for _, data in inputs)
+
+    # Warm imports so they are not charged to the first run, codecs load lazily now
+    import app  # noqa: F401
+    from utils import warmup
+    warmup.warm_up()
+    baseline_rss = _peak_rss_mb()
+
+    walls, cpus = [], []
+    for _ in range(repeat):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        output = _execute(target, [(file_name, data) for file_name, data in inputs])
+        walls.append(time.perf_counter() - wall_start)
+        cpus.append(time.process_time() - cpu_start)
+
+    megapixels = _input_megapixels(inputs)
+    return {
+        'wall_seconds': round(min(walls), 4),
+        'cpu_seconds': round(min(cpus), 4),
+        'cpu_seconds_per_megapixel': round(min(cpus) / megapixels, 4) if megapixels else None,
+        'input_megapixels': round(megapixels, 2),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'import_rss_mb': round(baseline_rss, 1),
+        'input_bytes': input_bytes,
+        'output_bytes': len(output),
+        'compression_ratio': round(len(output) / input_bytes, 4),
+    }
+
+def run_suite(names, corpus_dir, repeat, workers):
+    """Run every case in its own subprocess"""
+    env = dict(
+        os.environ,
+        RESULT_CACHE_MEMORY_BYTES='0',
+        RESULT_CACHE_DISK_BYTES='0',
+        COMPRESSION_MAX_WORKERS=str(workers),
+    )
+    results = {}
+    for name in names:
+        completed = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.run', '--case', name, '--corpus', corpus_dir, '--repeat', str(repeat)],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            results[name] = {'error': completed.stderr.strip().splitlines()[-1:]}
+        else:
+            results[name] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f'{name}: {results[name]}', file=sys.stderr)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Return regressions where a metric grew by more than tolerance over the baseline"""
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get('cases', {}).get(name)
+        if not previous or 'error' in metrics or 'error' in previous:
+            continue
+        for metric, noise_floor in COMPARED_METRICS.items():
+            current, before = metrics[metric], previous[metric]
+            if current > before * (1 + tolerance) and current - before > noise_floor:
+                regressions.append({
+                    'case': name,
+                    'metric': metric,
+                    'baseline': before,
+                    'current': current,
+                    'change': round(current / before - 1, 4) if before else None,
+                })
+    return regressions
+
+def main():
+    from benchmarks.corpus import DEFAULT_DIR, ensure_corpus
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=DEFAULT_DIR, help='Corpus directory, generated if missing')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the best is reported')
+    parser.add_argument('--workers', type=int, default=1, help='COMPRESSION_MAX_WORKERS for the cases')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    parser.add_argument('--compare', help='Baseline JSON report to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed relative growth before flagging')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.corpus, args.repeat)))
+        return 0
+
+    corpus_dir = ensure_corpus(args.corpus)
+    names = [name for name in CASES if args.filter in name]
+    report = {
+        'python': sys.version.split()[0],
+        'repeat': args.repeat,
+        'workers': args.workers,
+        'cases': run_suite(names, corpus_dir, args.repeat, args.workers),
+    }
+
+    exit_code = 1 if any('error' in metrics for metrics in report['cases'].values()) else 0
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            report['regressions'] = compare(report['cases'], json.load(baseline_file), args.tolerance)
+        if report['regressions']:
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    print(output)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,32 @@
+"""Cold start probe: time from a fresh interpreter to the first /api/health response.
+
+Run by benchmarks.run for the startup case, one fresh process per repeat,
+and prints one JSON line. Also reports which codec libraries were loaded
+by then, which should be none.
+"""
+import sys
+import json
+import time
+
+# Modules a health check should not need
+CODEC_MODULES = ('fitz', 'PIL.Image', 'services.image_compression_service', 'services.pdf_compression_service', 'services.pdf_conversion_service')
+
+def main():
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    from app import create_app
+    response = create_app().test_client().get('/api/health')
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+    from benchmarks.run import _peak_rss_mb
+    print(json.dumps({
+        'status_code': response.status_code,
+        'wall_seconds': round(wall, 4),
+        'cpu_seconds': round(cpu, 4),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'output_bytes': len(response.get_data()),
+        'codec_modules_loaded': [name for name in CODEC_MODULES if name in sys.modules],
+    }))
+    return 0 if response.status_code == 200 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,15 +7,127 @@ load_dotenv()
 class Config:
     # Flask configuration
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
-    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
+    UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')  # Created on first write
     
-    # Create uploads directory if it doesn't exist
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)
+    # Codec warm-up: 'preload' loads Pillow and PyMuPDF before gunicorn forks workers,
+    # 'background' loads them in a thread per worker so health checks answer immediately
+    WARM_UP = os.getenv('WARM_UP', 'background')
     
     # Allowed file extensions
     ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg'}
     ALLOWED_PDF_EXTENSIONS = {'pdf'}
     
+    # Already-compressed formats are stored in batch zips without re-deflating
+    ZIP_STORED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'avif', 'pdf'}
+    
     # Maximum file size (in bytes) - 25MB
-    MAX_CONTENT_LENGTH = 25 * 1024 * 1024 
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 25 * 1024 * 1024
+    
+    # Target-size image compression
+    IMAGE_MIN_QUALITY = 10
+    IMAGE_MAX_FULL_ENCODES = 2  # Full-resolution encodes per image
+    IMAGE_SAMPLE_TILE = 64  # Sample tile edge in pixels (multiple of 16)
+    IMAGE_SAMPLE_GRID = 6  # The sample is a grid x grid mosaic of tiles
+    RESIZE_REDUCING_GAP = 3.0  # Downscales reduce cheaply to within this factor before LANCZOS
+
+    # Images above this many pixels are converted, resized and encoded a strip of rows
+    # at a time for PNG output and JPG to PDF pages. PNG inputs are also decoded a strip
+    # at a time, other inputs are decoded whole once. JPEG output is only banded from
+    # PNGs decoded in strips, as banded JPEGs cannot optimize their Huffman tables
+    IMAGE_TILED_MIN_PIXELS = int(os.getenv('IMAGE_TILED_MIN_PIXELS', 40_000_000))
+    IMAGE_TILE_PIXELS = 1_000_000  # Pixels per strip, in whole 16-row bands (the JPEG MCU height)
+    
+    # PNG zlib effort presets chosen per request with the effort form field:
+    # (zlib level for truecolour, zlib level for palette images). Palette data is
+    # a third of the size, so level 9 there costs about what level 6 does on RGB
+    PNG_EFFORT_LEVELS = {
+        'fast': (1, 6),
+        'balanced': (6, 9),
+        'max': (9, 9),
+    }
+    PNG_DEFAULT_EFFORT = os.getenv('PNG_DEFAULT_EFFORT', 'balanced')
+    
+    # Opt-in output formats chosen per request with the format form field, lossy like
+    # JPEG but keeping transparency. The effort preset sets the encoder speed option:
+    # WebP method (0-6, higher is slower and smaller), AVIF speed (0-10, lower is slower
+    # and smaller). AVIF is only offered when the installed Pillow can write it
+    IMAGE_OUTPUT_FORMATS = {
+        'webp': {'format': 'WEBP', 'effort_param': 'method', 'effort': {'fast': 2, 'balanced': 4, 'max': 6}},
+        'avif': {'format': 'AVIF', 'effort_param': 'speed', 'effort': {'fast': 8, 'balanced': 6, 'max': 5}},
+    }
+    
+    # Several sizes of one image from one decode, for responsive images. A request
+    # without a variants field gets these presets; width None keeps the full size
+    IMAGE_VARIANT_PRESETS = [
+        {'name': 'thumbnail', 'width': 320},
+        {'name': 'web', 'width': 1280},
+        {'name': 'full', 'width': None},
+    ]
+    IMAGE_MAX_VARIANTS = 12
+    IMAGE_VARIANT_THREADS = int(os.getenv('IMAGE_VARIANT_THREADS', 4))  # Concurrent variant encodes per process
+    
+    # Batch compression worker pool. This is a per-process cap, not a host-wide one:
+    # every gunicorn worker (WEB_CONCURRENCY, as in gunicorn.conf.py) starts its own
+    # pool, so the host runs up to WEB_CONCURRENCY * COMPRESSION_MAX_WORKERS
+    # compression processes. The default splits the CPUs between the server processes
+    WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 2))
+    COMPRESSION_MAX_WORKERS = int(os.getenv(
+        'COMPRESSION_MAX_WORKERS', max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+    ))  # Pool processes per server process, 1 disables the pool
+    COMPRESSION_REQUEST_CONCURRENCY = int(os.getenv('COMPRESSION_REQUEST_CONCURRENCY', 4))  # Files in flight per request
+    
+    # PDF uploads larger than this are spooled to a temp file instead of opened in memory
+    PDF_IN_MEMORY_MAX_BYTES = int(os.getenv('PDF_IN_MEMORY_MAX_BYTES', 16 * 1024 * 1024))
+    
+    # PDF image recompression profiles, chosen per request with the profile form field:
+    # images shown above dpi are downsampled to it, then re-encoded as JPEG at quality.
+    # standard keeps every image's resolution, as PDF compression did before profiles
+    PDF_PROFILES = {
+        'standard': {'dpi': None, 'quality': 30},
+        'screen': {'dpi': 72, 'quality': 30},
+        'ebook': {'dpi': 150, 'quality': 40},
+        'print': {'dpi': 300, 'quality': 60},
+    }
+    PDF_DEFAULT_PROFILE = os.getenv('PDF_DEFAULT_PROFILE', 'standard')
+    PDF_DOWNSAMPLE_THRESHOLD = 1.1  # Images within 10% of the target DPI keep their resolution
+    PDF_MIN_IMAGE_BYTES = 10 * 1024  # Smaller image streams are left alone
+    PDF_JPEG_QUALITY_MARGIN = 10  # JPEGs within this many quality points are left alone
+    PDF_WORKERS = int(os.getenv('PDF_WORKERS', 4))  # Worker processes for one large PDF
+    PDF_PARALLEL_MIN_IMAGES = 8  # Fewer unique images are recompressed in-process
+    
+    # Size estimates for compression previews
+    ESTIMATE_JPEG_QUALITIES = [90, 80, 70, 60, 50, 40, 30]  # JPEG qualities reported besides the default run
+    ESTIMATE_PDF_SAMPLE_IMAGES = int(os.getenv('ESTIMATE_PDF_SAMPLE_IMAGES', 3))  # Largest images decoded and sampled
+    ESTIMATE_DECODE_PIXELS = 16_000_000  # Larger JPEGs are decoded at 1/2, 1/4 or 1/8 scale, keeping at least this many pixels
+    
+    # Background jobs
+    JOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'jobs')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))  # Jobs running at once per process
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 50))  # Queued and running jobs before rejecting
+    JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 60 * 60))  # Seconds before a job and its result expire
+    JOB_MAX_DISK_BYTES = int(os.getenv('JOB_MAX_DISK_BYTES', 500 * 1024 * 1024))  # Result storage budget
+    
+    # Resumable chunked uploads, for files above MAX_CONTENT_LENGTH
+    CHUNKED_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'chunked')
+    CHUNKED_UPLOAD_MAX_BYTES = int(os.getenv('CHUNKED_UPLOAD_MAX_BYTES', 512 * 1024 * 1024))  # Whole-file limit
+    CHUNKED_UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024  # Suggested chunk size, each chunk must fit MAX_CONTENT_LENGTH
+    CHUNKED_UPLOAD_TTL = int(os.getenv('CHUNKED_UPLOAD_TTL', 24 * 60 * 60))  # Seconds an idle upload is kept
+    CHUNKED_UPLOAD_LOCK_TIMEOUT = 60  # Seconds before an interrupted chunk write can be taken over
+    
+    # Result cache for repeated uploads (0 disables a tier)
+    RESULT_CACHE_MEMORY_BYTES = int(os.getenv('RESULT_CACHE_MEMORY_BYTES', 64 * 1024 * 1024))
+    RESULT_CACHE_DISK_BYTES = int(os.getenv('RESULT_CACHE_DISK_BYTES', 256 * 1024 * 1024))
+    RESULT_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, 'cache')
+    
+    # JPG to PDF conversion
+    JPG_TO_PDF_DPI = 200
+    JPG_TO_PDF_EMBED_MAX_WIDTH = int(os.getenv('JPG_TO_PDF_EMBED_MAX_WIDTH', 1654))  # Wider JPEGs are resized and re-encoded
+    
+    # Admission control from the decoded size of uploads, checked before any decoding
+    ADMISSION_MEMORY_BUDGET = int(os.getenv('ADMISSION_MEMORY_BUDGET', 1024 * 1024 * 1024))  # Estimated bytes in flight per process
+    ADMISSION_MAX_IMAGE_PIXELS = int(os.getenv('ADMISSION_MAX_IMAGE_PIXELS', 100_000_000))  # Larger images decoded whole are rejected with 413
+    ADMISSION_MAX_STREAMED_PIXELS = int(os.getenv('ADMISSION_MAX_STREAMED_PIXELS', 400_000_000))  # Limit for PNGs compressed in strips, e.g. 20000x20000 scans
+    ADMISSION_MAX_PDF_PAGES = int(os.getenv('ADMISSION_MAX_PDF_PAGES', 2000))  # Longer PDFs are rejected with 413
+    ADMISSION_IMAGE_COPIES = 3  # Decoded copies alive at once (decode, convert, resize)
+    ADMISSION_QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 10))  # Seconds to wait for budget before 429
+    ADMISSION_RETRY_AFTER = 5  # Retry-After seconds sent with 429
@@ -0,0 +1,30 @@
+import os
+
+# Server socket
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# Worker processes, each with a pool of request threads
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+
+# Import the app once in the master before forking, plus Pillow and PyMuPDF with WARM_UP=preload
+preload_app = True
+
+# Compressions of large files can take a while
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+def post_fork(server, worker):
+    # Each worker reports its own metrics, not the master's copy
+    from config.settings import Config
+    from utils import metrics, warmup
+    metrics.drain()
+    # Threads do not survive fork, so background warm-up starts in each worker
+    if Config.WARM_UP == 'background':
+        warmup.start_background()
+    server.log.info(f"Worker {worker.pid} ready")
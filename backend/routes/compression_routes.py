@@ -1,21 +1,75 @@
-from flask import Blueprint, request, send_file
-from services.image_compression_service import ImageCompressionService
-from services.pdf_compression_service import PdfCompressionService
-from utils.file_utils import allowed_file, secure_filename
+from flask import Blueprint, Response, request, send_file, stream_with_context
+from utils.admission import admission_controlled
+from utils.file_utils import IMAGE_MIMETYPES, allowed_file, image_extension, secure_filename, with_image_extension
+from utils.worker_pool import imap_ordered
+from utils.zip_stream import stream_zip
 from config.settings import Config
-import zipfile
-from io import BytesIO
+import itertools
 
 compression_bp = Blueprint('compression', __name__)
 
+def zip_response(members, download_name):
+    """Stream a zip of (name, data) members as an attachment"""
+    chunks = stream_zip(members)
+    # Produce the first member before responding so early failures still return an error
+    first_chunk = next(chunks)
+    return Response(
+        stream_with_context(itertools.chain([first_chunk], chunks)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={download_name}'}
+    )
+
+def image_options(fields):
+    """Return compress_image options from the optional fields of a form or JSON body.
+
+    Raises ValueError with the message for the client on an invalid field.
+    """
+    from services.image_compression_service import ImageCompressionService
+
+    # Optional encoder effort (PNG zlib level, WebP method, AVIF speed): fast, balanced or max
+    effort = fields.get('effort') or Config.PNG_DEFAULT_EFFORT
+    if not isinstance(effort, str) or effort not in Config.PNG_EFFORT_LEVELS:
+        raise ValueError(f'Unknown effort: {effort}')
+
+    # Optional output format: webp or avif, the input's own format by default
+    output_format = fields.get('format') or None
+    if output_format is not None and output_format not in ImageCompressionService.available_formats():
+        raise ValueError(f'Unknown or unavailable format: {output_format}')
+
+    # Optional starting quality for JPEG, WebP and AVIF, lowered as needed to reach the target size
+    quality = fields.get('quality') or None
+    if quality is not None:
+        quality = str(quality)
+        if not quality.isdigit() or not 1 <= int(quality) <= 100:
+            raise ValueError('Quality must be a whole number from 1 to 100')
+        quality = int(quality)
+    return {'effort': effort, 'output_format': output_format, 'quality': quality}
+
+def pdf_options(fields):
+    """Return compress_pdf options from the optional fields of a form or JSON body, raising ValueError"""
+    # Optional compression profile: standard (the default, keeps image resolution), screen, ebook or print
+    profile = fields.get('profile') or Config.PDF_DEFAULT_PROFILE
+    if not isinstance(profile, str) or profile not in Config.PDF_PROFILES:
+        raise ValueError(f'Unknown profile: {profile}')
+    return {'profile': profile}
+
 @compression_bp.route('/api/compress/image', methods=['POST'])
+@admission_controlled('image', streamed=True)
 def compress_image():
+    # Services load Pillow, imported on first use so the app starts without codecs
+    from services.image_compression_service import ImageCompressionService
+
     if 'files' not in request.files:
         return {'error': 'No files provided'}, 400
     
     files = request.files.getlist('files')
     if not files or all(f.filename == '' for f in files):
         return {'error': 'No selected file(s)'}, 400
+
+    try:
+        options = image_options(request.form)
+    except ValueError as e:
+        return {'error': str(e)}, 400
     
     try:
         # If only one file is uploaded, return the compressed file directly
@@ -28,55 +82,90 @@ def compress_image():
             filename = secure_filename(file.filename)
             
             # Compress the image
-            compressed_data = ImageCompressionService.compress_image(file)
+            compressed_data = ImageCompressionService.compress_image(file, **options)
             
-            # Return the compressed file
+            # Name and type the download after the format actually written
+            extension = image_extension(compressed_data.getbuffer())
             return send_file(
                 compressed_data,
-                mimetype='image/jpeg',
+                mimetype=IMAGE_MIMETYPES.get(extension, 'application/octet-stream'),
                 as_attachment=True,
-                download_name=f'compressed_{filename}'
+                download_name=f'compressed_{with_image_extension(filename, extension)}'
             )
         
-        # For multiple files, create a zip archive
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file in files:
-                if allowed_file(file.filename, Config.ALLOWED_IMAGE_EXTENSIONS):
-                    # Secure the filename
-                    filename = secure_filename(file.filename)
-                    
-                    # Compress the image
-                    compressed_data = ImageCompressionService.compress_image(file)
-                    
-                    # Add compressed file to the zip archive
-                    zip_file.writestr(f'compressed_{filename}', compressed_data.getvalue())
-                else:
-                    # Optionally handle disallowed files, e.g., skip or return an error
-                    print(f"File {file.filename} not allowed, skipping.")
-
-        # Move the buffer's position to the beginning before sending
-        zip_buffer.seek(0)
+        # For multiple files, stream a zip archive
+        # Skip disallowed files before handing the rest to the worker pool
+        allowed_files = []
+        for file in files:
+            if allowed_file(file.filename, Config.ALLOWED_IMAGE_EXTENSIONS):
+                allowed_files.append(file)
+            else:
+                # Optionally handle disallowed files, e.g., skip or return an error
+                print(f"File {file.filename} not allowed, skipping.")
 
-        # Return the zip file
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='compressed_images.zip'
+        # Compress the images in parallel, results arrive in upload order
+        results = imap_ordered(ImageCompressionService.compress_image, allowed_files, **options)
+        members = (
+            (f'compressed_{with_image_extension(secure_filename(file.filename), image_extension(compressed_data))}', compressed_data)
+            for file, compressed_data in zip(allowed_files, results)
         )
+
+        # Return the zip file
+        return zip_response(members, 'compressed_images.zip')
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+@compression_bp.route('/api/compress/image/variants', methods=['POST'])
+@admission_controlled('image')
+def compress_image_variants():
+    # Services load Pillow, imported on first use so the app starts without codecs
+    from services.image_variant_service import ImageVariantService
+
+    if 'files' not in request.files:
+        return {'error': 'No files provided'}, 400
+
+    files = request.files.getlist('files')
+    if len(files) != 1 or files[0].filename == '':
+        return {'error': 'Send exactly one image'}, 400
+    file = files[0]
+    if not allowed_file(file.filename, Config.ALLOWED_IMAGE_EXTENSIONS):
+        return {'error': 'File type not allowed'}, 400
+
+    effort = request.form.get('effort') or Config.PNG_DEFAULT_EFFORT
+    if effort not in Config.PNG_EFFORT_LEVELS:
+        return {'error': f'Unknown effort: {effort}'}, 400
+
+    # Optional JSON list of {name, width, format, quality, target_kb}, presets by default
+    try:
+        variants = ImageVariantService.parse_variants(request.form.get('variants'))
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    try:
+        # The image is decoded once, variants are zipped as their encodes finish
+        members = ImageVariantService.compress_variants(file, variants, effort=effort)
+        stem = secure_filename(file.filename).rsplit('.', 1)[0]
+        return zip_response(members, f'{stem}_variants.zip')
     except Exception as e:
         return {'error': str(e)}, 500
 
 @compression_bp.route('/api/compress/pdf', methods=['POST'])
+@admission_controlled('pdf')
 def compress_pdf():
+    # Services load PyMuPDF, imported on first use so the app starts without codecs
+    from services.pdf_compression_service import PdfCompressionService
+
     if 'files' not in request.files:
         return {'error': 'No files provided'}, 400
     
     files = request.files.getlist('files')
     if not files or all(f.filename == '' for f in files):
         return {'error': 'No selected file(s)'}, 400
+
+    try:
+        options = pdf_options(request.form)
+    except ValueError as e:
+        return {'error': str(e)}, 400
     
     try:
         # If only one file is uploaded, return the compressed file directly
@@ -89,7 +178,7 @@ def compress_pdf():
             filename = secure_filename(file.filename)
             
             # Compress the PDF
-            compressed_data = PdfCompressionService.compress_pdf(file)
+            compressed_data = PdfCompressionService.compress_pdf(file, **options)
             
             # Return the compressed file
             return send_file(
@@ -99,33 +188,24 @@ def compress_pdf():
                 download_name=f'compressed_{filename}'
             )
         
-        # For multiple files, create a zip archive
-        zip_buffer = BytesIO()
-        
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file in files:
-                if allowed_file(file.filename, Config.ALLOWED_PDF_EXTENSIONS):
-                    # Secure the filename
-                    filename = secure_filename(file.filename)
-                    
-                    # Compress the PDF
-                    compressed_data = PdfCompressionService.compress_pdf(file)
-                    
-                    # Add compressed file to the zip archive
-                    zip_file.writestr(f'compressed_{filename}', compressed_data.getvalue())
-                else:
-                    # Optionally handle disallowed files, e.g., skip or return an error
-                    print(f"File {file.filename} not allowed, skipping.")
-
-        # Move the buffer's position to the beginning before sending
-        zip_buffer.seek(0)
+        # For multiple files, stream a zip archive
+        # Skip disallowed files before handing the rest to the worker pool
+        allowed_files = []
+        for file in files:
+            if allowed_file(file.filename, Config.ALLOWED_PDF_EXTENSIONS):
+                allowed_files.append(file)
+            else:
+                # Optionally handle disallowed files, e.g., skip or return an error
+                print(f"File {file.filename} not allowed, skipping.")
 
-        # Return the zip file
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name='compressed_pdfs.zip'
+        # Compress the PDFs in parallel, results arrive in upload order
+        results = imap_ordered(PdfCompressionService.compress_pdf, allowed_files, **options)
+        members = (
+            (f'compressed_{secure_filename(file.filename)}', compressed_data)
+            for file, compressed_data in zip(allowed_files, results)
         )
+
+        # Return the zip file
+        return zip_response(members, 'compressed_pdfs.zip')
     except Exception as e:
         return {'error': str(e)}, 500 
\ No newline at end of file
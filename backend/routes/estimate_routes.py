@@ -0,0 +1,45 @@
+from flask import Blueprint, jsonify, request
+from utils.admission import admission_controlled
+from utils.file_utils import allowed_file
+from config.settings import Config
+import time
+
+estimate_bp = Blueprint('estimate', __name__)
+
+def estimate_response(files, allowed_extensions, estimate):
+    """Estimate each uploaded file, reporting disallowed or unreadable files inline"""
+    if not files or all(f.filename == '' for f in files):
+        return {'error': 'No selected file(s)'}, 400
+
+    start = time.perf_counter()
+    results = []
+    for file in files:
+        if not allowed_file(file.filename, allowed_extensions):
+            results.append({'filename': file.filename, 'error': 'File type not allowed'})
+            continue
+        try:
+            results.append({'filename': file.filename, **estimate(file)})
+        except Exception as e:
+            results.append({'filename': file.filename, 'error': str(e)})
+
+    return jsonify({'files': results, 'seconds': round(time.perf_counter() - start, 4)})
+
+@estimate_bp.route('/image', methods=['POST'])
+@admission_controlled('image')
+def estimate_image():
+    # Loads Pillow, imported on first use so the app starts without codecs
+    from services.size_estimator import SizeEstimator
+
+    if 'files' not in request.files:
+        return {'error': 'No files provided'}, 400
+    return estimate_response(request.files.getlist('files'), Config.ALLOWED_IMAGE_EXTENSIONS, SizeEstimator.estimate_image)
+
+@estimate_bp.route('/pdf', methods=['POST'])
+@admission_controlled('pdf')
+def estimate_pdf():
+    # Loads PyMuPDF, imported on first use so the app starts without codecs
+    from services.size_estimator import SizeEstimator
+
+    if 'files' not in request.files:
+        return {'error': 'No files provided'}, 400
+    return estimate_response(request.files.getlist('files'), Config.ALLOWED_PDF_EXTENSIONS, SizeEstimator.estimate_pdf)
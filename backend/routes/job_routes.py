@@ -0,0 +1,76 @@
+from flask import Blueprint, jsonify, request, send_file, url_for
+from routes.compression_routes import image_options, pdf_options
+from services.job_service import JobService, JobQueueFullError
+from utils.admission import AdmissionError
+
+job_bp = Blueprint('jobs', __name__)
+
+def job_response(job):
+    """Serialize a job record with its polling and download URLs"""
+    return {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'error': job['error'],
+        'result_size': job['result_size'],
+        'status_url': url_for('jobs.job_status', job_id=job['id']),
+        'result_url': url_for('jobs.job_result', job_id=job['id']),
+    }
+
+@job_bp.route('/<kind>', methods=['POST'])
+def submit_job(kind):
+    if kind not in JobService.KINDS:
+        return {'error': f'Unknown job type: {kind}'}, 404
+
+    if 'files' not in request.files:
+        return {'error': 'No files provided'}, 400
+    
+    files = request.files.getlist('files')
+    if not files or all(f.filename == '' for f in files):
+        return {'error': 'No selected file(s)'}, 400
+
+    # The same optional fields as the synchronous routes
+    try:
+        if kind == 'image':
+            options = image_options(request.form)
+        elif kind == 'pdf':
+            options = pdf_options(request.form)
+        else:
+            options = {}
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    try:
+        job = JobService.submit(kind, files, options)
+        return jsonify(job_response(job)), 202
+    except JobQueueFullError as e:
+        return {'error': str(e)}, 503
+    except AdmissionError as e:
+        return {'error': str(e)}, e.status_code
+    except Exception as e:
+        return {'error': str(e)}, 500
+
+@job_bp.route('/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Polls also fail jobs orphaned by a restarted worker and drop expired results
+    JobService.expire()
+    job = JobService.get(job_id)
+    if job is None:
+        return {'error': 'Job not found or expired'}, 404
+    return jsonify(job_response(job)), 200
+
+@job_bp.route('/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    JobService.expire()
+    job = JobService.get(job_id)
+    if job is None:
+        return {'error': 'Job not found or expired'}, 404
+    if job['status'] != 'done':
+        return jsonify(job_response(job)), 409
+
+    return send_file(
+        JobService.result_path(job_id),
+        mimetype=job['mimetype'],
+        as_attachment=True,
+        download_name=job['download_name']
+    )
@@ -0,0 +1,86 @@
+from flask import Blueprint, jsonify, request, url_for
+from config.settings import Config
+from routes.compression_routes import image_options, pdf_options
+from routes.job_routes import job_response
+from services.job_service import JobService, JobQueueFullError
+from services.upload_service import UploadService, UploadError
+from utils.admission import AdmissionError
+
+upload_bp = Blueprint('uploads', __name__)
+
+def upload_response(upload):
+    """Serialize an upload record, including its job once compression has started"""
+    job = JobService.get(upload['job_id']) if upload['job_id'] else None
+    return {
+        'upload_id': upload['id'],
+        'kind': upload['kind'],
+        'filename': upload['filename'],
+        'size': upload['size'],
+        'offset': upload['offset'],
+        'status': upload['status'],
+        'chunk_size': Config.CHUNKED_UPLOAD_CHUNK_BYTES,
+        'upload_url': url_for('uploads.upload_chunk', upload_id=upload['id']),
+        'job': job_response(job) if job else None,
+    }
+
+def error_response(e):
+    body = {'error': str(e)}
+    if getattr(e, 'offset', None) is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status_code
+
+@upload_bp.route('', methods=['POST'])
+def create_upload():
+    # JSON body: {"kind": "pdf", "filename": "...", "size": bytes, "sha256": optional hex digest},
+    # plus the optional fields of the compression route for kind (effort, format, quality or profile)
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('kind') == 'image':
+            options = image_options(data)
+        elif data.get('kind') == 'pdf':
+            options = pdf_options(data)
+        else:
+            options = {}
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    try:
+        upload = UploadService.create(
+            data.get('kind'), data.get('filename'), data.get('size'), data.get('sha256'), options
+        )
+        return jsonify(upload_response(upload)), 201
+    except UploadError as e:
+        return error_response(e)
+
+@upload_bp.route('/<upload_id>', methods=['PATCH'])
+def upload_chunk(upload_id):
+    # The raw body is the chunk, written at the Upload-Offset header without form parsing
+    offset = request.headers.get('Upload-Offset', type=int)
+    if offset is None:
+        return {'error': 'Upload-Offset header required'}, 400
+    if request.content_length is None:
+        return {'error': 'Content-Length required'}, 411
+
+    try:
+        upload = UploadService.append(upload_id, offset, request.stream, request.content_length)
+    except (UploadError, AdmissionError) as e:
+        return error_response(e)
+    except JobQueueFullError as e:
+        # The file is kept, an empty chunk at the final offset retries queueing
+        return {'error': str(e)}, 503
+
+    return jsonify(upload_response(upload)), 202 if upload['job_id'] else 200
+
+@upload_bp.route('/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    upload = UploadService.get(upload_id)
+    if upload is None:
+        return {'error': 'Upload not found or expired'}, 404
+    return jsonify(upload_response(upload)), 200
+
+@upload_bp.route('/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    if UploadService.get(upload_id) is None:
+        return {'error': 'Upload not found or expired'}, 404
+    UploadService.delete(upload_id)
+    return '', 204
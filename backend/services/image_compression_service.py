@@ -1,192 +1,160 @@
 import os
 import logging
 from io import BytesIO
-from PIL import Image
+from PIL import Image, ImageChops
 from config.settings import Config
+from services.image_normalizer import ImageNormalizer
+from services.image_strips import ImageStrips, StripReader, strip_rows
+from services.quality_predictor import QualityPredictor
+from services.result_cache import ResultCache
+from utils import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ImageCompressionService:
+    # PNG levers ordered from least to most lossy: (max dimension, palette colours or None for truecolour)
+    PNG_LEVELS = [(None, None), (None, 256), (1920, 256), (1280, 128), (800, 64)]
+
+    @staticmethod
+    def compress_image(file, effort=None, output_format=None, quality=None):
+        """Compress image file, reusing the cached result for identical uploads.
+
+        effort picks a PNG_EFFORT_LEVELS preset, trading zlib time for size,
+        and the encoder speed for WebP and AVIF. output_format is an
+        IMAGE_OUTPUT_FORMATS key to re-encode into instead of the input's own
+        format. quality replaces the starting quality of lossy encodes.
+        Callers can tell the written format with file_utils.image_extension,
+        an input that does not get smaller is returned as it is.
+        """
+        effort = effort or Config.PNG_DEFAULT_EFFORT
+        input_size = file.seek(0, os.SEEK_END)
+        key = ResultCache.key_for_file(
+            file, ImageCompressionService._cache_params(file.filename, effort, output_format, quality)
+        )
+        cached = ResultCache.get(key)
+        if cached is not None:
+            logger.debug(f"Cache hit for file: {file.filename}")
+            metrics.record_transfer('image', input_size, len(cached))
+            return BytesIO(cached)
+
+        compressed_output = ImageCompressionService._compress_image(file, effort, output_format, quality)
+        ResultCache.put(key, compressed_output.getvalue())
+        metrics.record_transfer('image', input_size, compressed_output.getbuffer().nbytes)
+        return compressed_output
+
+    @staticmethod
+    def available_formats():
+        """IMAGE_OUTPUT_FORMATS keys the installed Pillow can write"""
+        Image.init()
+        return [name for name, settings in Config.IMAGE_OUTPUT_FORMATS.items() if settings['format'] in Image.SAVE]
+
+    @staticmethod
+    def _output_format(filename, output_format):
+        """Return the Pillow format to write: the requested one, else PNG or JPEG by input"""
+        if output_format is None:
+            return 'PNG' if filename.lower().endswith('.png') else 'JPEG'
+        if output_format not in ImageCompressionService.available_formats():
+            raise ValueError(f"Output format not available: {output_format}")
+        return Config.IMAGE_OUTPUT_FORMATS[output_format]['format']
+
     @staticmethod
-    def compress_image(file):
+    def _cache_params(filename, effort, output_format=None, quality=None):
+        """Parameters that affect the compressed output, for the result cache key"""
+        is_png = output_format is None and filename.lower().endswith('.png')
+        return {
+            'service': 'image',
+            'format': output_format or ('PNG' if is_png else 'JPEG'),
+            'png_params': Config.PNG_EFFORT_LEVELS[effort] if is_png else None,
+            'encoder_params': ImageCompressionService._encoder_params(output_format, effort),
+            'quality': quality,
+            'min_quality': Config.IMAGE_MIN_QUALITY,
+            'max_full_encodes': Config.IMAGE_MAX_FULL_ENCODES,
+            'sample': [Config.IMAGE_SAMPLE_TILE, Config.IMAGE_SAMPLE_GRID],
+        }
+
+    @staticmethod
+    def _encoder_params(output_format, effort):
+        """Speed options for an IMAGE_OUTPUT_FORMATS encode at effort, e.g. {'method': 4} for WebP"""
+        if output_format is None:
+            return {}
+        settings = Config.IMAGE_OUTPUT_FORMATS[output_format]
+        return {settings['effort_param']: settings['effort'][effort]}
+
+    @staticmethod
+    def _compress_image(file, effort, output_format=None, requested_quality=None):
         """Compress image file with size-based logic"""
         try:
             # Read the image
-            logger.info(f"Starting compression for file: {file.filename}")
+            logger.debug(f"Starting compression for file: {file.filename}")
             image = Image.open(file)
             
             # Get original dimensions
             width, height = image.size
-            logger.info(f"Original dimensions: {width}x{height}")
+            logger.debug(f"Original dimensions: {width}x{height}")
 
             # Get original size in MB
-            original_size = file.seek(0, os.SEEK_END) / (1024 * 1024) # Convert bytes to MB
+            original_bytes = file.seek(0, os.SEEK_END)
+            original_size = original_bytes / (1024 * 1024) # Convert bytes to MB
             file.seek(0) # Reset file pointer to the beginning
-            logger.info(f"Original size: {original_size:.2f} MB")
-
-            # Set initial quality and target size based on original size
-            if original_size > 1:
-                quality = 85
-                target_size_mb = original_size * 0.3  # Target 30% of original size
-            elif original_size >= 0.5:
-                quality = 75
-                target_size_mb = original_size * 0.4  # Target 40% of original size
-            elif original_size >= 0.1:  # 100KB (0.1 MB) - 500KB (0.5 MB)
-                quality = 85
-                target_size_mb = original_size * 0.6  # Target 60% of original size
-            else:  # < 100KB (0.1 MB)
-                quality = 90
-                target_size_mb = original_size * 0.8  # Target 80% of original size
-
-            logger.info(f"Initial quality: {quality}, Target size: {target_size_mb:.2f} MB")
-
-            # Determine output format based on original format
-            is_png = file.filename.lower().endswith('.png')
-            output_format = 'PNG' if is_png else 'JPEG'
-            logger.info(f"Output format: {output_format}")
-
-            # Handle different image modes
-            if is_png:
-                # For PNG, ensure we're using the most efficient mode
-                if image.mode == 'RGBA':
-                    logger.info("Keeping transparency for PNG")
-                elif image.mode == 'P':
-                    # Convert palette mode to RGBA if it has transparency
-                    if 'transparency' in image.info:
-                        logger.info("Converting palette PNG with transparency to RGBA")
-                        image = image.convert('RGBA')
-                    else:
-                        logger.info("Converting palette PNG to RGB")
-                        image = image.convert('RGB')
-                elif image.mode != 'RGB':
-                    logger.info(f"Converting {image.mode} to RGB")
-                    image = image.convert('RGB')
-            else:
-                # For JPEG, convert RGBA to RGB
-                if image.mode == 'RGBA':
-                    logger.info("Converting RGBA to RGB for JPEG")
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[3])
-                    image = background
-                elif image.mode != 'RGB':
-                    logger.info(f"Converting {image.mode} to RGB")
-                    image = image.convert('RGB')
-
-            def compress_with_params(img, qual, target_size, max_attempts=3):  # Reduced max attempts
-                """Helper function to compress image with given parameters"""
-                best_output = None
-                best_size = float('inf')
-                attempts = 0
-                current_quality = qual
-                current_width, current_height = img.size
-
-                while attempts < max_attempts:
-                    try:
-                        compressed_output = BytesIO()
-                        
-                        if output_format == 'PNG':
-                            # For PNG, use optimize=True and compress_level
-                            if img.mode == 'RGB' and current_quality < 70:
-                                # Reduce colors for better compression
-                                colors = max(256, int(256 * (current_quality / 100)))
-                                img_quantized = img.quantize(colors=colors, method=2)
-                                img_quantized.save(compressed_output, format='PNG', optimize=True, compress_level=6)  # Reduced compression level
-                            else:
-                                img.save(compressed_output, format='PNG', optimize=True, compress_level=6)  # Reduced compression level
-                        else:
-                            # For JPEG, we use quality parameter
-                            img.save(compressed_output, format='JPEG', quality=current_quality, optimize=True)
-                        
-                        compressed_output.seek(0)
-                        compressed_size = compressed_output.getbuffer().nbytes / (1024 * 1024)  # Convert to MB
-                        logger.info(f"Attempt {attempts + 1}: Size = {compressed_size:.2f} MB, Quality = {current_quality}")
-
-                        # If this is the best compression so far, save it
-                        if compressed_size < best_size:
-                            best_size = compressed_size
-                            best_output = compressed_output
-                            best_output.seek(0)
-
-                        # If we've achieved target size, we're done
-                        if compressed_size <= target_size:
-                            logger.info(f"Target size achieved: {compressed_size:.2f} MB")
-                            break
-
-                        # If we haven't achieved target size, try different approaches
-                        if output_format == 'PNG':
-                            # For PNG, try resizing if the image is large
-                            if current_width > 1920 or current_height > 1920:
-                                ratio = min(1920/current_width, 1920/current_height)
-                                new_width = int(current_width * ratio)
-                                new_height = int(current_height * ratio)
-                                img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                current_width, current_height = new_width, new_height
-                                logger.info(f"Resized to {new_width}x{new_height}")
-                            else:
-                                # If we can't resize further, try reducing quality
-                                current_quality = max(20, current_quality - 20)  # Larger quality reduction
-                        else:
-                            # For JPEG, reduce quality
-                            current_quality = max(20, current_quality - 20)  # Larger quality reduction
-
-                        attempts += 1
-                    except Exception as e:
-                        logger.error(f"Error in compression attempt {attempts + 1}: {str(e)}")
-                        if best_output is not None:
-                            return best_output, best_size
-                        raise
-
-                return best_output, best_size
+            logger.debug(f"Original size: {original_size:.2f} MB")
+
+            quality, target_bytes = ImageCompressionService.size_target(original_bytes)
+            quality = requested_quality or quality
+            logger.debug(f"Initial quality: {quality}, Target size: {target_bytes / (1024 * 1024):.2f} MB")
+
+            # Determine output format based on original format, unless one was requested
+            pillow_format = ImageCompressionService._output_format(file.filename, output_format)
+            logger.debug(f"Output format: {pillow_format}")
+
+            # Banded JPEGs lose optimized Huffman tables, worth it only when the source
+            # is streamed too, a whole decode is most of the memory anyway
+            reader = None
+            if pillow_format in ('JPEG', 'PNG') and ImageStrips.can_tile(image):
+                reader = StripReader(image)
+            if reader is not None and (pillow_format == 'PNG' or reader.streamed):
+                logger.debug(f"Compressing {width}x{height} in strips of {strip_rows(width)} rows")
+                try:
+                    compressed_output = ImageCompressionService._compress_tiled(
+                        reader, pillow_format, quality, target_bytes, effort
+                    )
+                except Exception:
+                    logger.warning(f"Tiled compression of {file.filename} failed, returning the original", exc_info=True)
+                    compressed_output = None
+                if compressed_output is None or compressed_output.getbuffer().nbytes >= original_bytes:
+                    file.seek(0)
+                    return BytesIO(file.read())
+                return compressed_output
+
+            with metrics.timer('image_decode'):
+                image.load()
+
+            with metrics.timer('image_convert'):
+                # PNG, WebP and AVIF keep transparency and grayscale, JPEG gets alpha flattened onto white
+                if pillow_format == 'JPEG':
+                    image = ImageNormalizer.flatten(image)
+                else:
+                    image = ImageNormalizer.for_png(image)
+                logger.debug(f"Encoding from {image.mode}")
 
             try:
-                # First attempt with initial parameters
-                logger.info("Starting first compression attempt")
-                compressed_output, compressed_size = compress_with_params(image, quality, target_size_mb)
+                if pillow_format == 'PNG':
+                    compressed_output = ImageCompressionService._compress_png(image, target_bytes, effort)
+                else:
+                    compressed_output = ImageCompressionService._compress_lossy(
+                        image, pillow_format, quality, target_bytes,
+                        **ImageCompressionService._encoder_params(output_format, effort)
+                    )
+                compressed_size = compressed_output.getbuffer().nbytes / (1024 * 1024)  # Convert to MB
 
-                # If compressed size is larger than original, try more aggressive compression
-                if compressed_size >= original_size:
-                    logger.info("First attempt failed, trying more aggressive compression")
-                    # Try with more aggressive parameters
-                    if output_format == 'PNG':
-                        # For PNG, try with smaller dimensions
-                        if width > 1280 or height > 1280:
-                            ratio = min(1280/width, 1280/height)
-                            new_width = int(width * ratio)
-                            new_height = int(height * ratio)
-                            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                            logger.info(f"Resized to {new_width}x{new_height}")
-                    else:
-                        # For JPEG, try with lower quality
-                        quality = 60
-
-                    compressed_output, compressed_size = compress_with_params(image, quality, target_size_mb)
-
-                # If still larger than original, try one last time with minimum quality
-                if compressed_size >= original_size:
-                    logger.info("Second attempt failed, trying minimum quality")
-                    if output_format == 'PNG':
-                        # For PNG, try with even smaller dimensions
-                        if width > 800 or height > 800:
-                            ratio = min(800/width, 800/height)
-                            new_width = int(width * ratio)
-                            new_height = int(height * ratio)
-                            image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                            logger.info(f"Resized to {new_width}x{new_height}")
-                    else:
-                        # For JPEG, use minimum quality
-                        quality = 10
-
-                    compressed_output, compressed_size = compress_with_params(image, quality, target_size_mb)
-
-                # If still larger than original, return original image
+                # If larger than original, return original image
                 if compressed_size >= original_size:
-                    logger.info("All compression attempts failed, returning original image")
+                    logger.debug("Compression did not reduce size, returning original image")
                     file.seek(0)
                     return BytesIO(file.read())
 
-                logger.info(f"Compression successful. Final size: {compressed_size:.2f} MB")
+                logger.debug(f"Compression successful. Final size: {compressed_size:.2f} MB")
                 return compressed_output
 
             except Exception as e:
@@ -197,4 +165,267 @@ class ImageCompressionService:
 
         except Exception as e:
             logger.error(f"Critical error in compression: {str(e)}")
-            raise Exception(f"Error compressing image: {str(e)}") 
\ No newline at end of file
+            raise Exception(f"Error compressing image: {str(e)}")
+
+    @staticmethod
+    def size_target(original_bytes):
+        """Return (initial JPEG quality, target bytes) for an input of original_bytes"""
+        original_size = original_bytes / (1024 * 1024)
+        if original_size > 1:
+            return 85, original_bytes * 0.3  # Target 30% of original size
+        if original_size >= 0.5:
+            return 75, original_bytes * 0.4  # Target 40% of original size
+        if original_size >= 0.1:  # 100KB (0.1 MB) - 500KB (0.5 MB)
+            return 85, original_bytes * 0.6  # Target 60% of original size
+        return 90, original_bytes * 0.8  # < 100KB (0.1 MB), target 80% of original size
+
+    @staticmethod
+    def _resize_to(image, max_dimension):
+        """Downscale image so neither side exceeds max_dimension"""
+        width, height = image.size
+        if max_dimension is None or (width <= max_dimension and height <= max_dimension):
+            return image
+        ratio = min(max_dimension / width, max_dimension / height)
+        # reducing_gap box-reduces by an integer factor first, then LANCZOS finishes the resize
+        return image.resize(
+            (int(width * ratio), int(height * ratio)),
+            Image.Resampling.LANCZOS,
+            reducing_gap=Config.RESIZE_REDUCING_GAP
+        )
+
+    @staticmethod
+    def _compress_lossy(image, output_format, max_quality, target_bytes, **params):
+        """Encode JPEG, WebP or AVIF at the quality predicted to hit target_bytes.
+
+        Keyword params are encoder options, such as the WebP method.
+        """
+        sample, scale = QualityPredictor.build_sample(image)
+
+        def encode(quality):
+            return QualityPredictor.encode(image, output_format, quality, **params)
+
+        return ImageCompressionService._fit_quality(sample, scale, encode, output_format, max_quality, target_bytes, **params)
+
+    @staticmethod
+    def _fit_quality(sample, scale, encode, output_format, max_quality, target_bytes, **params):
+        """Run the full encodes of the lossy target-size loop.
+
+        encode(quality) returns the full image encoded at quality, sample and
+        scale come from QualityPredictor.build_sample and params are the
+        encoder options encode uses.
+        """
+        # A requested quality below the usual floor is still honoured
+        min_quality = min(Config.IMAGE_MIN_QUALITY, max_quality)
+        with metrics.timer('image_predict'):
+            quality = QualityPredictor.predict_quality(
+                sample, scale, target_bytes, min_quality, max_quality, output_format, **params
+            )
+
+        best = None
+        for attempt in range(Config.IMAGE_MAX_FULL_ENCODES):
+            with metrics.timer('image_encode'):
+                data = encode(quality)
+            logger.debug(f"Encode {attempt + 1}: Size = {len(data) / (1024 * 1024):.2f} MB, Quality = {quality}")
+
+            if best is None or len(data) < len(best):
+                best = data
+            if len(data) <= target_bytes or quality <= min_quality:
+                break
+
+            # Correct the target by how far the full encode missed the prediction
+            estimate = QualityPredictor.estimate_size(sample, scale, output_format, quality, **params)
+            corrected_target = target_bytes * estimate / len(data)
+            with metrics.timer('image_predict'):
+                quality = QualityPredictor.predict_quality(
+                    sample, scale, corrected_target, min_quality, quality - 1, output_format, **params
+                )
+
+        metrics.observe('yukomp_image_encode_attempts', attempt + 1, format=output_format)
+        return BytesIO(best)
+
+    @staticmethod
+    def _compress_tiled(reader, pillow_format, max_quality, target_bytes, effort):
+        """JPEG or PNG encode of an image above IMAGE_TILED_MIN_PIXELS, a strip of rows at a time.
+
+        Settings are predicted from the same tile sample as the in-memory
+        path. JPEGs, only made from streamed PNG sources, are joined from
+        bands with standard Huffman tables. PNG palettes are fixed from the
+        sample, or from the exact colour count, and RGBA keeps truecolour at
+        full size as Pillow cannot map RGBA onto a given palette.
+        """
+        size = reader.size
+        if pillow_format == 'JPEG':
+            def strips():
+                return ((top, ImageNormalizer.flatten(strip)) for top, strip in reader.strips())
+
+            sample, scale = ImageStrips.build_sample(ImageStrips.window(strips(), size))
+
+            def encode(quality):
+                return ImageStrips.encode_jpeg(strips(), size, quality)
+
+            return ImageCompressionService._fit_quality(
+                sample, scale, encode, 'JPEG', max_quality, target_bytes, optimize=False
+            )
+
+        def strips():
+            return ((top, ImageNormalizer.for_png(strip)) for top, strip in reader.strips())
+
+        truecolor_level, palette_level = Config.PNG_EFFORT_LEVELS[effort]
+        window = ImageStrips.window(strips(), size)
+        sample = ImageStrips.build_sample(window)
+        mode = window.mode
+
+        palette = None
+        if mode == 'RGB':
+            with metrics.timer('png_color_count'):
+                colors = ImageStrips.colors(strips())
+            if colors is not None:
+                exact = Image.new('P', (1, 1))
+                exact.putpalette([value for color in colors for value in color])
+                palette = (exact, len(colors), Image.Quantize.FASTOCTREE)
+                logger.debug(f"Lossless palette with {len(colors)} colours")
+
+        levels, start, prepare = ImageCompressionService._plan_png(window, palette, target_bytes, effort, sample=sample)
+        levels = levels[start:]
+        if mode == 'RGBA':
+            # Full-size palettes need the whole image to quantize, downscales follow truecolour
+            levels = [
+                (max_dimension, colors) for max_dimension, colors in levels if max_dimension or not colors
+            ] or [(None, None)]
+
+        def encode_level(max_dimension, colors):
+            if max_dimension is None:
+                level_strips = strips()
+                if colors is not None:
+                    # One palette for every strip
+                    fixed = palette[0] if palette is not None and colors == palette[1] else (
+                        sample[0].quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+                    )
+                    level_strips = (
+                        (top, strip.quantize(palette=fixed, dither=Image.Dither.NONE)) for top, strip in level_strips
+                    )
+                return ImageStrips.encode_png(level_strips, size, palette_level if colors else truecolor_level)
+
+            # Downscaled levels are small enough to finish in memory
+            width, height = size
+            ratio = min(max_dimension / width, max_dimension / height)
+            output_size = (int(width * ratio), int(height * ratio))
+            img = prepare(ImageStrips.assemble(ImageStrips.resize(strips(), size, output_size), output_size), max_dimension, colors)
+            return QualityPredictor.encode(img, 'PNG', compress_level=palette_level if img.mode == 'P' else truecolor_level)
+
+        return ImageCompressionService._fit_png_level(levels, encode_level, target_bytes)
+
+    @staticmethod
+    def _lossless_palette(image):
+        """Return (palette image, colours, method) when image fits in 256 colours, else None"""
+        if image.mode not in ('RGB', 'RGBA'):
+            return None
+        with metrics.timer('png_color_count'):
+            # Counted in C and abandoned as soon as a 257th colour shows up
+            colors = image.getcolors(256)
+        if colors is None:
+            return None
+
+        # Fast octree is exact for most small palettes, max coverage covers the rest of RGB
+        methods = [Image.Quantize.FASTOCTREE]
+        if image.mode == 'RGB':
+            methods.append(Image.Quantize.MAXCOVERAGE)
+        with metrics.timer('png_palette'):
+            for method in methods:
+                paletted = image.quantize(colors=len(colors), method=method, dither=Image.Dither.NONE)
+                extrema = ImageChops.difference(paletted.convert(image.mode), image).getextrema()
+                if all(high == 0 for _, high in extrema):
+                    logger.debug(f"Lossless palette with {len(colors)} colours")
+                    return paletted, len(colors), method
+        return None
+
+    @staticmethod
+    def _plan_png(image, palette, target_bytes, effort, sample=None):
+        """Predict the PNG encode for target_bytes from a sample.
+
+        palette is the result of _lossless_palette(image). Returns (levels,
+        index of the first level predicted to fit, prepare) where
+        prepare(img, max_dimension, colors) applies a level's palette to img.
+        sample is a prebuilt (sample, scale) pair, built from image if not given.
+        """
+        truecolor_level, palette_level = Config.PNG_EFFORT_LEVELS[effort]
+        width, height = image.size
+
+        levels = []
+        for max_dimension, colors in ImageCompressionService.PNG_LEVELS:
+            if max_dimension is not None and width <= max_dimension and height <= max_dimension:
+                max_dimension = None
+            if image.mode not in ('RGB', 'RGBA'):
+                colors = None
+            elif palette is not None:
+                # Never use more colours than the image has, at full size that is the lossless palette
+                colors = min(colors or 256, palette[1])
+            level = (max_dimension, colors)
+            if level not in levels:
+                levels.append(level)
+
+        def prepare(img, max_dimension, colors):
+            lossless = palette is not None and max_dimension is None and colors == palette[1]
+            if lossless and img is image:
+                return palette[0]
+            if colors is None:
+                return img
+            if lossless:
+                # The sample has a subset of the image's colours, quantize it the same way
+                return img.quantize(colors=colors, method=palette[2], dither=Image.Dither.NONE)
+            return img.quantize(colors=colors, method=Image.Quantize.FASTOCTREE)
+
+        sample, scale = sample or QualityPredictor.build_sample(image)
+
+        with metrics.timer('image_predict'):
+            # Pick the first level whose predicted size fits the target
+            start = len(levels) - 1
+            for index, (max_dimension, colors) in enumerate(levels):
+                ratio = 1.0
+                if max_dimension is not None:
+                    ratio = min(max_dimension / width, max_dimension / height) ** 2
+                prepared = prepare(sample, None, colors)
+                estimate = QualityPredictor.estimate_size(
+                    prepared, scale * ratio, 'PNG',
+                    compress_level=palette_level if prepared.mode == 'P' else truecolor_level
+                )
+                logger.debug(f"Predicted size at max dimension {max_dimension}, colours {colors}: {estimate / (1024 * 1024):.2f} MB")
+                if estimate <= target_bytes:
+                    start = index
+                    break
+        return levels, start, prepare
+
+    @staticmethod
+    def _compress_png(image, target_bytes, effort):
+        """Encode PNG at the least lossy level predicted to hit target_bytes"""
+        truecolor_level, palette_level = Config.PNG_EFFORT_LEVELS[effort]
+        palette = ImageCompressionService._lossless_palette(image)
+        levels, start, prepare = ImageCompressionService._plan_png(image, palette, target_bytes, effort)
+
+        def encode_level(max_dimension, colors):
+            img = prepare(ImageCompressionService._resize_to(image, max_dimension), max_dimension, colors)
+            return QualityPredictor.encode(
+                img, 'PNG', compress_level=palette_level if img.mode == 'P' else truecolor_level
+            )
+
+        return ImageCompressionService._fit_png_level(levels[start:], encode_level, target_bytes)
+
+    @staticmethod
+    def _fit_png_level(levels, encode_level, target_bytes):
+        """Run the full encodes of the PNG ladder, from the first level predicted to fit.
+
+        encode_level(max_dimension, colors) returns the image encoded at that level.
+        """
+        best = None
+        for attempt, (max_dimension, colors) in enumerate(levels[:Config.IMAGE_MAX_FULL_ENCODES]):
+            with metrics.timer('image_encode'):
+                data = encode_level(max_dimension, colors)
+            logger.debug(f"Encode {attempt + 1}: Size = {len(data) / (1024 * 1024):.2f} MB, Max dimension = {max_dimension}, Colours = {colors}")
+
+            if best is None or len(data) < len(best):
+                best = data
+            if len(data) <= target_bytes:
+                break
+
+        metrics.observe('yukomp_image_encode_attempts', attempt + 1, format='PNG')
+        return BytesIO(best)
@@ -0,0 +1,76 @@
+import logging
+from PIL import Image
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ImageNormalizer:
+    """Bring decoded images into the modes the JPEG and PNG encoders take.
+
+    Every supported input (RGBA, LA, P with transparency, CMYK, 16-bit and
+    1-bit) is converted here with at most one full-size intermediate.
+    """
+
+    BACKGROUND = (255, 255, 255)
+
+    # Raw unpackers that read the high byte of each 16-bit sample
+    SIXTEEN_BIT_RAW_MODES = {'I;16': 'L;16', 'I;16L': 'L;16', 'I;16B': 'L;16B'}
+
+    @staticmethod
+    def has_alpha(image):
+        return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+    @staticmethod
+    def _to_8bit(image):
+        """Reduce 16-bit, 32-bit and 1-bit grayscale to L, other modes pass through"""
+        if image.mode in ImageNormalizer.SIXTEEN_BIT_RAW_MODES:
+            # Unpack the high bytes straight into L instead of clipping through mode I
+            return Image.frombytes('L', image.size, image.tobytes(), 'raw', ImageNormalizer.SIXTEEN_BIT_RAW_MODES[image.mode])
+        if image.mode == 'I':
+            return image.point(lambda value: value * (1 / 256)).convert('L')
+        if image.mode == 'F':
+            return image.point(lambda value: value * 255).convert('L')
+        if image.mode == '1':
+            return image.convert('L')
+        return image
+
+    @staticmethod
+    def flatten(image, keep_gray=True):
+        """Return image as RGB, or L when it is grayscale and keep_gray is set.
+
+        Transparency is composited onto a white background in one pass:
+        the image's own alpha band is the paste mask, so no band images are
+        split out.
+        """
+        image = ImageNormalizer._to_8bit(image)
+
+        if ImageNormalizer.has_alpha(image):
+            if image.mode in ('P', 'PA'):
+                image = image.convert('RGBA')
+            if keep_gray and image.mode == 'LA':
+                background = Image.new('L', image.size, 255)
+                background.paste(image.getchannel('L'), mask=image)
+            else:
+                background = Image.new('RGB', image.size, ImageNormalizer.BACKGROUND)
+                background.paste(image, mask=image)
+            logger.debug(f"Flattened {image.mode} onto white")
+            return background
+
+        if keep_gray and image.mode == 'L':
+            return image
+        if image.mode != 'RGB':
+            # CMYK, YCbCr, LAB and opaque palettes
+            return image.convert('RGB')
+        return image
+
+    @staticmethod
+    def for_png(image):
+        """Return image as RGB, RGBA or L, keeping transparency"""
+        image = ImageNormalizer._to_8bit(image)
+
+        if ImageNormalizer.has_alpha(image):
+            return image if image.mode == 'RGBA' else image.convert('RGBA')
+        if image.mode in ('RGB', 'L'):
+            return image
+        return image.convert('RGB')
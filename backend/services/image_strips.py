@@ -0,0 +1,363 @@
+import math
+import zlib
+import struct
+import logging
+from PIL import Image
+from config.settings import Config
+from services.quality_predictor import QualityPredictor
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pillow's decompression bomb guard would refuse streamed scans, admission enforces the real limits
+Image.MAX_IMAGE_PIXELS = Config.ADMISSION_MAX_STREAMED_PIXELS
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Samples per pixel by PNG colour type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+def strip_rows(width):
+    """Rows per strip of an image width, whole 16-row bands within IMAGE_TILE_PIXELS"""
+    return max(16, Config.IMAGE_TILE_PIXELS // width // 16 * 16)
+
+def _stack(upper, lower):
+    """Return a new image with lower pasted under upper"""
+    stacked = Image.new(upper.mode, (upper.width, upper.height + lower.height))
+    stacked.paste(upper, (0, 0))
+    stacked.paste(lower, (0, upper.height))
+    if upper.mode == 'P':
+        stacked.putpalette(upper.getpalette())
+    stacked.info.update(upper.info)
+    return stacked
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+def _split_png(data):
+    """Return (everything before the first IDAT, the joined IDAT data) of an encoded PNG"""
+    position = len(PNG_SIGNATURE)
+    head_end = None
+    idat = []
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        if kind == b'IDAT':
+            head_end = head_end or position
+            idat.append(data[position + 8:position + 8 + length])
+        position += length + 12
+    return data[:head_end], b''.join(idat)
+
+def _split_jpeg(data):
+    """Return (everything up to and including SOS, the entropy-coded scan) of a baseline JPEG"""
+    position = 2  # SOI
+    while True:
+        marker = data[position + 1]
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        position += 2 + length
+        if marker == 0xDA:  # SOS
+            # Pillow ends the scan with EOI
+            return data[:position], data[position:-2]
+
+def _restart_header(header, height, interval):
+    """Set the frame height of a JPEG header and add a restart interval before SOS"""
+    position = 2
+    while True:
+        marker = header[position + 1]
+        length = struct.unpack('>H', header[position + 2:position + 4])[0]
+        if marker == 0xC0:  # SOF0: length, precision, then the height
+            header = header[:position + 5] + struct.pack('>H', height) + header[position + 7:]
+        if marker == 0xDA:
+            return header[:position] + b'\xff\xdd' + struct.pack('>HH', 4, interval) + header[position:]
+        position += 2 + length
+
+
+class StripReader:
+    """Read an opened, not yet loaded image as strips of whole rows.
+
+    Non-interlaced PNGs are inflated and decoded a strip at a time: each
+    strip is decoded behind the last row of the one before, which is all
+    the PNG filters refer to. Other images are decoded whole once and
+    cropped, Pillow cannot stop their decoders part way.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.size = image.size
+        self.mode = image.mode
+        self._rawmode = None
+        if image.format != 'PNG' or len(image.tile) != 1:
+            return
+
+        # IHDR follows the signature, Pillow does not report interlacing
+        image.fp.seek(len(PNG_SIGNATURE) + 8)
+        _, _, self._bit_depth, self._color_type, _, _, interlace = struct.unpack('>IIBBBBB', image.fp.read(13))
+        rawmode = image.tile[0][3]
+        try:
+            # The previous row is handed back to the decoder packed as it was stored
+            Image.new(image.mode, (1, 1)).tobytes('raw', rawmode)
+        except (ValueError, OSError):
+            logger.debug(f"No packer for PNG raw mode {rawmode}, decoding it whole")
+            return
+        if not interlace:
+            self._rawmode = rawmode
+
+    @property
+    def streamed(self):
+        return self._rawmode is not None
+
+    def strips(self, rows=None):
+        """Yield (top row, strip image) down the image"""
+        rows = rows or strip_rows(self.size[0])
+        if not self.streamed:
+            # Decoded on the first pass, later passes crop the same pixels
+            self.image.load()
+            width, height = self.size
+            for top in range(0, height, rows):
+                yield top, self.image.crop((0, top, width, min(height, top + rows)))
+            return
+        yield from self._png_strips(rows)
+
+    def _idat(self):
+        fp = self.image.fp
+        fp.seek(len(PNG_SIGNATURE))
+        while True:
+            length, kind = struct.unpack('>I4s', fp.read(8))
+            if kind == b'IEND':
+                return
+            data = fp.read(length)
+            fp.read(4)  # CRC
+            if kind == b'IDAT':
+                yield data
+
+    def _png_strips(self, rows):
+        width, height = self.size
+        # Filter byte plus packed samples
+        stride = 1 + (width * PNG_CHANNELS[self._color_type] * self._bit_depth + 7) // 8
+
+        chunks = self._idat()
+        inflater = zlib.decompressobj()
+        previous = None  # Last row of the previous strip, packed, behind a 'none' filter byte
+        for top in range(0, height, rows):
+            count = min(rows, height - top)
+            needed = count * stride
+            filtered = bytearray()
+            while len(filtered) < needed:
+                # Inflate no further than this strip
+                if inflater.unconsumed_tail:
+                    filtered += inflater.decompress(inflater.unconsumed_tail, needed - len(filtered))
+                else:
+                    data = next(chunks, None)
+                    if data is None:
+                        raise ValueError('PNG image data is truncated')
+                    filtered += inflater.decompress(data, needed - len(filtered))
+
+            context = 0 if previous is None else 1
+            stream = zlib.compress((previous or b'') + filtered, 0)
+            strip = Image.frombytes(self.mode, (width, count + context), stream, 'zip', self._rawmode)
+            if context:
+                strip = strip.crop((0, 1, width, count + 1))
+            if self.mode == 'P':
+                strip.putpalette(self.image.palette)
+            strip.info.update(self.image.info)
+            previous = b'\x00' + strip.crop((0, count - 1, width, count)).tobytes('raw', self._rawmode)
+            yield top, strip
+
+
+class _RowWindow:
+    """The rows of a strip sequence, read on demand and released once passed.
+
+    Quacks like an image for QualityPredictor.build_sample, as long as
+    crops move down the image.
+    """
+
+    def __init__(self, strips, size):
+        self._strips = iter(strips)
+        self.size = size
+        self._mode = None
+        self._band = None
+        self._top = 0
+
+    @property
+    def mode(self):
+        if self._mode is None:
+            self.band(0, 1)
+        return self._mode
+
+    def band(self, top, bottom):
+        """Return (image holding at least rows top to bottom, its first row)"""
+        width = self.size[0]
+        if self._band is not None:
+            drop = min(top, self._top + self._band.height) - self._top
+            if drop == self._band.height:
+                self._band = None
+                self._top += drop
+            elif drop > 0:
+                self._band = self._band.crop((0, drop, width, self._band.height))
+                self._top += drop
+
+        while self._band is None or self._top + self._band.height < bottom:
+            strip_top, strip = next(self._strips)
+            self._mode = strip.mode
+            if strip_top + strip.height <= top:
+                continue
+            if self._band is None:
+                self._band, self._top = strip, strip_top
+            else:
+                self._band = _stack(self._band, strip)
+        return self._band, self._top
+
+    def crop(self, box):
+        left, upper, right, lower = box
+        band, band_top = self.band(upper, lower)
+        return band.crop((left, upper - band_top, right, lower - band_top))
+
+
+class ImageStrips:
+    """Resize and encode images given as strips of rows, holding a strip or two at a time.
+
+    Strips are (top row, image) pairs in order, such as StripReader.strips()
+    yields. Encoded outputs are single JPEG and PNG files, the same as
+    encoding the assembled image.
+    """
+
+    @staticmethod
+    def should_tile(image):
+        return image.width * image.height > Config.IMAGE_TILED_MIN_PIXELS
+
+    @staticmethod
+    def can_tile(image):
+        """Whether compress_image works on image in strips, with room for two sample tiles each way"""
+        return ImageStrips.should_tile(image) and min(image.size) >= 2 * Config.IMAGE_SAMPLE_TILE
+
+    @staticmethod
+    def window(strips, size):
+        """Return a view of the strips that QualityPredictor.build_sample can sample"""
+        return _RowWindow(strips, size)
+
+    @staticmethod
+    def build_sample(window):
+        """QualityPredictor.build_sample of a window() over strips"""
+        sample, scale = QualityPredictor.build_sample(window)
+        if sample is window:
+            # Small images are their own sample, which has to be a real image
+            sample = window.crop((0, 0) + window.size)
+        return sample, scale
+
+    @staticmethod
+    def assemble(strips, size):
+        """Paste strips into one image, for results small enough to hold"""
+        image = None
+        for top, strip in strips:
+            if image is None:
+                image = Image.new(strip.mode, size)
+                if strip.mode == 'P':
+                    image.putpalette(strip.getpalette())
+                image.info.update(strip.info)
+            image.paste(strip, (0, top))
+        return image
+
+    @staticmethod
+    def colors(strips, max_colors=256):
+        """Return the distinct colours of the strips, or None past max_colors"""
+        seen = set()
+        for _, strip in strips:
+            # Counted in C and abandoned as soon as too many colours show up
+            colors = strip.getcolors(max_colors)
+            if colors is None:
+                return None
+            seen.update(color for _, color in colors)
+            if len(seen) > max_colors:
+                return None
+        return sorted(seen)
+
+    @staticmethod
+    def resize(strips, size, output_size):
+        """Downscale the strips of an image of size to output_size, yielding output strips.
+
+        Each output strip is resampled from its source rows plus the rows the
+        LANCZOS filter reaches on either side, so strips join without seams.
+        """
+        width, height = size
+        output_width, output_height = output_size
+        scale = height / output_height
+        margin = math.ceil(3 * max(scale, 1)) + 1
+        # About a strip of source rows per output strip, in whole JPEG MCU rows
+        rows = max(16, int(strip_rows(width) / scale) // 16 * 16)
+
+        window = _RowWindow(strips, size)
+        for top in range(0, output_height, rows):
+            bottom = min(output_height, top + rows)
+            source_top, source_bottom = top * scale, bottom * scale
+            band, band_top = window.band(
+                max(0, int(source_top) - margin), min(height, math.ceil(source_bottom) + margin)
+            )
+            strip = band.resize(
+                (output_width, bottom - top), Image.Resampling.LANCZOS,
+                box=(0, source_top - band_top, width, source_bottom - band_top)
+            )
+            yield top, strip
+
+    @staticmethod
+    def encode_jpeg(strips, size, quality):
+        """Encode RGB or L strips as one baseline JPEG.
+
+        Every band of rows is encoded on its own with the standard Huffman
+        tables and the bands are joined as restart intervals, which decodes
+        to the same pixels as one encode without optimized tables.
+        """
+        width, height = size
+        window = _RowWindow(strips, size)
+        # Pillow subsamples colour 4:2:0, so an MCU is 16x16 pixels, 8x8 for grayscale
+        mcu = 8 if window.mode == 'L' else 16
+        mcus_per_row = -(-width // mcu)
+        # A restart interval counts at most 65535 MCUs
+        band_rows = mcu * max(1, min(strip_rows(width) // mcu, 65535 // mcus_per_row))
+
+        header = None
+        scan = []
+        for index, top in enumerate(range(0, height, band_rows)):
+            band = window.crop((0, top, width, min(height, top + band_rows)))
+            head, entropy = _split_jpeg(QualityPredictor.encode(band, 'JPEG', quality, optimize=False))
+            if header is None:
+                header = head
+            else:
+                scan.append(bytes((0xFF, 0xD0 + (index - 1) % 8)))  # RST0-RST7
+            scan.append(entropy)
+        interval = mcus_per_row * (band_rows // mcu)
+        return _restart_header(header, height, interval) + b''.join(scan) + b'\xff\xd9'
+
+    @staticmethod
+    def encode_png(strips, size, compress_level):
+        """Encode strips as one PNG, deflating the filtered rows in a single stream.
+
+        Pillow filters each strip behind the last row of the one before, so
+        the rows are filtered exactly as in one encode of the whole image.
+        """
+        width, height = size
+        deflater = None
+        header = None
+        chunks = []
+        previous = None
+        for _, strip in strips:
+            band = strip if previous is None else _stack(previous, strip)
+            # Stored deflate, only the filtering is kept
+            head, idat = _split_png(QualityPredictor.encode(band, 'PNG', compress_level=0))
+            filtered = zlib.decompress(idat)
+            stride = len(filtered) // band.height
+            if deflater is None:
+                # The strategies Pillow picks: 8-bit palette rows are left unfiltered, the rest are filtered
+                strategy = zlib.Z_DEFAULT_STRATEGY if band.mode == 'P' and stride == width + 1 else zlib.Z_FILTERED
+                deflater = zlib.compressobj(compress_level, zlib.DEFLATED, 15, 9, strategy)
+            if previous is None:
+                # Patch the image height into IHDR
+                ihdr = head[16:20] + struct.pack('>I', height) + head[24:29]
+                header = head[:16] + ihdr + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr)) + head[33:]
+            else:
+                filtered = filtered[stride:]
+            compressed = deflater.compress(filtered)
+            if compressed:
+                chunks.append(_png_chunk(b'IDAT', compressed))
+            previous = strip.crop((0, strip.height - 1, width, strip.height))
+        chunks.append(_png_chunk(b'IDAT', deflater.flush()))
+        chunks.append(_png_chunk(b'IEND', b''))
+        return header + b''.join(chunks)
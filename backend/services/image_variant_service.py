@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from config.settings import Config
+from services.image_compression_service import ImageCompressionService
+from services.image_normalizer import ImageNormalizer
+from utils import metrics
+from utils.file_utils import image_extension, secure_filename
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ImageVariantService:
+    """Produce several sizes and formats of one image from a single decode.
+
+    The upload is decoded and normalized once. Variants are resized in a
+    cascade, each width from the next larger one, and every variant is
+    encoded on a thread as soon as its pixels are ready.
+    """
+
+    # Variant formats besides IMAGE_OUTPUT_FORMATS
+    BASE_FORMATS = {'jpeg', 'png'}
+    FIELDS = {'name', 'width', 'format', 'quality', 'target_kb'}
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def _get_executor():
+        # Encoders release the GIL, so threads share one decoded image without copying it
+        with ImageVariantService._executor_lock:
+            if ImageVariantService._executor is None:
+                ImageVariantService._executor = ThreadPoolExecutor(max_workers=Config.IMAGE_VARIANT_THREADS)
+        return ImageVariantService._executor
+
+    @staticmethod
+    def parse_variants(spec):
+        """Validate a JSON list of variants, or return IMAGE_VARIANT_PRESETS when spec is empty.
+
+        Each variant is an object with a name and optional width (pixels,
+        never upscaled), format (jpeg, png, webp or avif, else the input's
+        own), quality (1-100) and target_kb. Raises ValueError on the first
+        invalid entry.
+        """
+        if not spec:
+            return [dict(variant) for variant in Config.IMAGE_VARIANT_PRESETS]
+        try:
+            variants = json.loads(spec)
+        except ValueError:
+            raise ValueError('Variants must be a JSON list')
+        if not isinstance(variants, list) or not variants:
+            raise ValueError('Variants must be a non-empty JSON list')
+        if len(variants) > Config.IMAGE_MAX_VARIANTS:
+            raise ValueError(f'At most {Config.IMAGE_MAX_VARIANTS} variants per request')
+
+        formats = ImageVariantService.BASE_FORMATS | set(ImageCompressionService.available_formats())
+        names = set()
+        for variant in variants:
+            if not isinstance(variant, dict) or set(variant) - ImageVariantService.FIELDS:
+                raise ValueError(f'Variant fields are {", ".join(sorted(ImageVariantService.FIELDS))}')
+            name = secure_filename(str(variant.get('name') or ''))
+            if not name or name in names:
+                raise ValueError('Every variant needs a unique name')
+            names.add(name)
+            variant['name'] = name
+            for field, low, high in (('width', 1, None), ('quality', 1, 100), ('target_kb', 1, None)):
+                value = variant.get(field)
+                if value is not None and (type(value) is not int or value < low or (high and value > high)):
+                    limits = f'from {low} to {high}' if high else f'of at least {low}'
+                    raise ValueError(f'Variant {name}: {field} must be a whole number {limits}')
+            if variant.get('format') is not None and variant['format'] not in formats:
+                raise ValueError(f'Variant {name}: unknown or unavailable format {variant["format"]}')
+        return variants
+
+    @staticmethod
+    def compress_variants(file, variants, effort=None):
+        """Yield (filename, data) for each variant, in the order given.
+
+        Without target_kb, a variant aims for the size compress_image would,
+        scaled by its share of the original pixels. Like compress_image, a
+        full-size variant in the input's own format that does not come out
+        smaller is replaced by the original file.
+        """
+        effort = effort or Config.PNG_DEFAULT_EFFORT
+        original_bytes = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        default_quality, default_target = ImageCompressionService.size_target(original_bytes)
+        is_png = file.filename.lower().endswith('.png')
+        own_format = 'png' if is_png else 'jpeg'
+        stem = secure_filename(file.filename).rsplit('.', 1)[0]
+
+        with metrics.timer('image_decode'):
+            image = Image.open(file)
+            image.load()
+        with metrics.timer('image_convert'):
+            # Keep transparency once, JPEG variants flatten their own smaller copy
+            image = ImageNormalizer.for_png(image)
+        width, height = image.size
+        logger.debug(f"Decoded {file.filename} once for {len(variants)} variants")
+
+        # Largest first, so every resize starts from the closest larger size
+        sizes = {}
+        for output_width in sorted({min(variant.get('width') or width, width) for variant in variants}, reverse=True):
+            sizes[output_width] = (output_width, max(1, round(height * output_width / width)))
+
+        executor = ImageVariantService._get_executor()
+        futures = {}
+        source = image
+        try:
+            for output_width, size in sizes.items():
+                if size != source.size:
+                    with metrics.timer('variant_resize'):
+                        source = source.resize(size, Image.Resampling.LANCZOS, reducing_gap=Config.RESIZE_REDUCING_GAP)
+                for index, variant in enumerate(variants):
+                    if min(variant.get('width') or width, width) != output_width:
+                        continue
+                    target_bytes = variant['target_kb'] * 1024 if variant.get('target_kb') else (
+                        default_target * (size[0] * size[1]) / (width * height)
+                    )
+                    futures[index] = executor.submit(
+                        ImageVariantService._encode, source, variant.get('format') or own_format,
+                        variant.get('quality') or default_quality, target_bytes, effort
+                    )
+
+            for index, variant in enumerate(variants):
+                data = futures[index].result()
+                full_size = min(variant.get('width') or width, width) == width
+                if full_size and (variant.get('format') or own_format) == own_format and len(data) >= original_bytes:
+                    file.seek(0)
+                    data = file.read()
+                extension = image_extension(data)
+                logger.debug(f"Variant {variant['name']}: {len(data) / 1024:.1f} KB {extension}")
+                yield f"{stem}_{variant['name']}.{extension}", data
+        finally:
+            # Drop queued encodes if the client went away or a variant failed
+            for future in futures.values():
+                future.cancel()
+
+    @staticmethod
+    def _encode(image, output_format, quality, target_bytes, effort):
+        """Encode one variant through the same target-size loops as compress_image"""
+        if output_format == 'png':
+            return ImageCompressionService._compress_png(image, target_bytes, effort).getvalue()
+        if output_format == 'jpeg':
+            return ImageCompressionService._compress_lossy(
+                ImageNormalizer.flatten(image), 'JPEG', quality, target_bytes
+            ).getvalue()
+        return ImageCompressionService._compress_lossy(
+            image, Config.IMAGE_OUTPUT_FORMATS[output_format]['format'], quality, target_bytes,
+            **ImageCompressionService._encoder_params(output_format, effort)
+        ).getvalue()
@@ -0,0 +1,332 @@
+import os
+import json
+import uuid
+import time
+import shutil
+import sqlite3
+import logging
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from werkzeug.datastructures import FileStorage
+from config.settings import Config
+from utils import admission
+from utils.file_utils import allowed_file, image_extension, secure_filename, with_image_extension
+from utils.worker_pool import imap_ordered, run
+from utils.zip_stream import stream_zip
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already waiting"""
+
+class JobService:
+    """Run compressions in the background and keep their results on disk.
+
+    Job records live in SQLite under JOB_FOLDER so any worker process can
+    answer status and result requests; the work itself runs on a bounded
+    thread executor in the process that accepted the job.
+    """
+
+    # Columns added after the first release, created on databases that predate them
+    ADDED_COLUMNS = {'owner_pid': 'INTEGER', 'options': 'TEXT'}
+
+    # Job kinds: (allowed extensions, zip name for batches), tasks come from _task
+    COMPRESSION_KINDS = {
+        'image': (Config.ALLOWED_IMAGE_EXTENSIONS, 'compressed_images.zip'),
+        'pdf': (Config.ALLOWED_PDF_EXTENSIONS, 'compressed_pdfs.zip'),
+    }
+    KINDS = set(COMPRESSION_KINDS) | {'jpg-to-pdf'}
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @staticmethod
+    def _connect():
+        os.makedirs(Config.JOB_FOLDER, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(Config.JOB_FOLDER, 'jobs.sqlite3'), timeout=10)
+        connection.row_factory = sqlite3.Row
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                download_name TEXT,
+                mimetype TEXT,
+                result_size INTEGER,
+                error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                owner_pid INTEGER,
+                options TEXT
+            )
+        ''')
+        existing = {row['name'] for row in connection.execute('PRAGMA table_info(jobs)')}
+        for name, definition in JobService.ADDED_COLUMNS.items():
+            if name not in existing:
+                try:
+                    connection.execute(f'ALTER TABLE jobs ADD COLUMN {name} {definition}')
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+        return connection
+
+    @staticmethod
+    def _update(job_id, **fields):
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with JobService._connect() as connection:
+            connection.execute(f'UPDATE jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+
+    @staticmethod
+    def _job_dir(job_id):
+        return os.path.join(Config.JOB_FOLDER, job_id)
+
+    @staticmethod
+    def _owner_alive(job):
+        """Whether the process that queued a pending job can still finish it"""
+        if job['owner_pid'] is None:
+            # Queued before jobs recorded their owner, only trusted for JOB_RESULT_TTL
+            return job['created_at'] >= time.time() - Config.JOB_RESULT_TTL
+        try:
+            os.kill(job['owner_pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def _get_executor():
+        with JobService._executor_lock:
+            if JobService._executor is None:
+                JobService._executor = ThreadPoolExecutor(max_workers=Config.JOB_WORKERS)
+        return JobService._executor
+
+    @staticmethod
+    def _check_capacity():
+        JobService.expire()
+
+        with JobService._connect() as connection:
+            pending = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+        if pending >= Config.JOB_MAX_PENDING:
+            raise JobQueueFullError('Too many jobs are waiting, please retry later')
+
+    @staticmethod
+    def _streamed(kind, options):
+        """Whether large PNG inputs of the job are compressed in strips, as JPEG or PNG"""
+        return kind == 'image' and not (options or {}).get('output_format')
+
+    @staticmethod
+    def submit(kind, files, options=None):
+        """Persist the uploads and queue a job, returning its record.
+
+        options are the keyword options of the kind's compression, as the
+        synchronous routes pass them.
+        """
+        JobService._check_capacity()
+
+        # Reject oversized inputs now, the budget itself is taken when the job runs
+        cost = admission.estimate_cost(kind, files, JobService._streamed(kind, options))
+
+        job_id = uuid.uuid4().hex
+        input_dir = os.path.join(JobService._job_dir(job_id), 'inputs')
+        os.makedirs(input_dir)
+
+        # Uploads are gone once the request ends, so keep a copy for the job
+        inputs = []
+        for index, file in enumerate(files):
+            if file.filename == '':
+                continue
+            path = os.path.join(input_dir, str(index))
+            file.save(path)
+            inputs.append((file.filename, path))
+
+        return JobService._enqueue(job_id, kind, inputs, cost, options)
+
+    @staticmethod
+    def submit_spooled(kind, filename, spool_path, options=None):
+        """Queue a job for a file already on disk, moving it into the job instead of copying"""
+        JobService._check_capacity()
+
+        with open(spool_path, 'rb') as spool:
+            cost = admission.estimate_cost(
+                kind, [FileStorage(stream=spool, filename=filename)], JobService._streamed(kind, options)
+            )
+
+        job_id = uuid.uuid4().hex
+        input_dir = os.path.join(JobService._job_dir(job_id), 'inputs')
+        os.makedirs(input_dir)
+        path = os.path.join(input_dir, '0')
+        os.replace(spool_path, path)
+
+        return JobService._enqueue(job_id, kind, [(filename, path)], cost, options)
+
+    @staticmethod
+    def _enqueue(job_id, kind, inputs, cost, options=None):
+        options = options or {}
+        with JobService._connect() as connection:
+            connection.execute(
+                'INSERT INTO jobs (id, kind, status, created_at, owner_pid, options) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, kind, 'queued', time.time(), os.getpid(), json.dumps(options))
+            )
+
+        JobService._get_executor().submit(JobService._run, job_id, kind, inputs, cost, options)
+        logger.info(f"Queued {kind} job {job_id} with {len(inputs)} files")
+        return JobService.get(job_id)
+
+    @staticmethod
+    def get(job_id):
+        """Return the job record as a dict, or None if unknown or expired"""
+        with JobService._connect() as connection:
+            row = connection.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def result_path(job_id):
+        return os.path.join(JobService._job_dir(job_id), 'result')
+
+    @staticmethod
+    def _run(job_id, kind, inputs, cost, options=None):
+        acquired = False
+        files = []
+        try:
+            # Queued jobs wait for budget instead of being rejected
+            admission.acquire(cost)
+            acquired = True
+            JobService._update(job_id, status='running')
+            files = [FileStorage(stream=open(path, 'rb'), filename=filename) for filename, path in inputs]
+
+            if kind == 'jpg-to-pdf':
+                download_name, chunks = JobService._convert(files)
+            else:
+                download_name, chunks = JobService._compress(kind, files, options or {})
+
+            result_size = 0
+            with open(JobService.result_path(job_id), 'wb') as result_file:
+                for chunk in chunks:
+                    result_file.write(chunk)
+                    result_size += len(chunk)
+
+            JobService._update(
+                job_id,
+                status='done',
+                download_name=download_name,
+                mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+                result_size=result_size,
+                finished_at=time.time()
+            )
+            logger.info(f"Job {job_id} finished, {result_size / (1024 * 1024):.2f} MB")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            try:
+                JobService._update(job_id, status='failed', error=str(e), finished_at=time.time())
+            except Exception:
+                # expire() fails the job once this process is gone
+                logger.warning(f"Could not record the failure of job {job_id}", exc_info=True)
+        finally:
+            if acquired:
+                admission.release(cost)
+            for file in files:
+                file.close()
+            shutil.rmtree(os.path.join(JobService._job_dir(job_id), 'inputs'), ignore_errors=True)
+
+    @staticmethod
+    def _task(kind):
+        """Return the compression function for kind, importing its codec libraries on first use"""
+        if kind == 'image':
+            from services.image_compression_service import ImageCompressionService
+            return ImageCompressionService.compress_image
+        from services.pdf_compression_service import PdfCompressionService
+        return PdfCompressionService.compress_pdf
+
+    @staticmethod
+    def _compress(kind, files, options):
+        """Return (download name, output chunks) for a compression job run with options"""
+        allowed_extensions, zip_name = JobService.COMPRESSION_KINDS[kind]
+        task = JobService._task(kind)
+        allowed_files = [file for file in files if allowed_file(file.filename, allowed_extensions)]
+        if not allowed_files:
+            raise ValueError('File type not allowed')
+
+        def output_name(file, compressed_data):
+            filename = secure_filename(file.filename)
+            if kind == 'image':
+                # Name the output after the format actually written, e.g. WebP
+                filename = with_image_extension(filename, image_extension(compressed_data))
+            return f'compressed_{filename}'
+
+        if len(files) == 1:
+            compressed_data = run(task, allowed_files[0], **options)
+            return output_name(allowed_files[0], compressed_data), [compressed_data]
+
+        results = imap_ordered(task, allowed_files, **options)
+        members = (
+            (output_name(file, compressed_data), compressed_data)
+            for file, compressed_data in zip(allowed_files, results)
+        )
+        return zip_name, stream_zip(members)
+
+    @staticmethod
+    def _convert(files):
+        """Return (download name, output chunks) for a JPG to PDF job"""
+        from services.pdf_conversion_service import PdfConversionService
+
+        pdf_buffer = PdfConversionService.images_to_pdf(files)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return f'converted_{timestamp}.pdf', [pdf_buffer.getvalue()]
+
+    @staticmethod
+    def expire():
+        """Fail jobs whose process exited, then delete finished jobs past JOB_RESULT_TTL
+        and the oldest results over JOB_MAX_DISK_BYTES.
+
+        Pending jobs are never deleted, they finish or fail first.
+        """
+        now = time.time()
+        with JobService._connect() as connection:
+            # A worker restarted mid-job (gunicorn max_requests, a crash) leaves its jobs pending
+            stale = [
+                row['id'] for row in connection.execute(
+                    "SELECT id, owner_pid, created_at FROM jobs WHERE status IN ('queued', 'running')"
+                )
+                if not JobService._owner_alive(row)
+            ]
+            for job_id in stale:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                    "WHERE id = ? AND status IN ('queued', 'running')",
+                    ('The server process running this job exited, please resubmit', now, job_id)
+                )
+
+            expired = [row['id'] for row in connection.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND COALESCE(finished_at, created_at) < ?",
+                (now - Config.JOB_RESULT_TTL,)
+            )]
+
+            # Evict the oldest finished results until disk usage is within budget
+            used = 0
+            for row in connection.execute(
+                "SELECT id, result_size FROM jobs WHERE status = 'done' ORDER BY finished_at DESC"
+            ):
+                if row['id'] in expired:
+                    continue
+                used += row['result_size'] or 0
+                if used > Config.JOB_MAX_DISK_BYTES:
+                    expired.append(row['id'])
+
+            for job_id in expired:
+                connection.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+        for job_id in stale:
+            shutil.rmtree(os.path.join(JobService._job_dir(job_id), 'inputs'), ignore_errors=True)
+        for job_id in expired:
+            shutil.rmtree(JobService._job_dir(job_id), ignore_errors=True)
+        if stale:
+            logger.warning(f"Failed {len(stale)} jobs left pending by exited processes")
+        if expired:
+            logger.info(f"Expired {len(expired)} jobs")
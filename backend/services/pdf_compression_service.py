@@ -1,7 +1,15 @@
 import os
+import math
+import shutil
+import tempfile
 from io import BytesIO
 import fitz  # PyMuPDF
 from config.settings import Config
+from services.image_normalizer import ImageNormalizer
+from services.quality_predictor import QualityPredictor
+from services.result_cache import ResultCache
+from utils import metrics
+from utils.worker_pool import collect, disk_path, get_executor
 import logging
 from PIL import Image
 import io
@@ -13,92 +21,140 @@ logger = logging.getLogger(__name__)
 
 class PdfCompressionService:
     @staticmethod
-    def compress_pdf(file):
+    def _load_upload(file):
+        """Return an uploaded PDF as (source, size in bytes, temp path or None).
+
+        Uploads up to PDF_IN_MEMORY_MAX_BYTES are returned as bytes. Larger
+        ones are opened from their own file when already on disk, or copied
+        to a unique per-request temp file that the caller must remove.
+        """
+        size = file.seek(0, os.SEEK_END)
+        file.seek(0)
+
+        if size <= Config.PDF_IN_MEMORY_MAX_BYTES:
+            return file.read(), size, None
+
+        path = disk_path(file)
+        if path is not None:
+            return path, size, None
+
+        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix='.pdf', dir=Config.UPLOAD_FOLDER)
+        with os.fdopen(fd, 'wb') as temp_file:
+            shutil.copyfileobj(file, temp_file)
+        logger.debug(f"Spooled {size / (1024 * 1024):.2f} MB upload to temporary file")
+        return temp_path, size, temp_path
+
+    @staticmethod
+    def _open_source(source):
+        """Open a PDF from bytes or from a file path"""
+        if isinstance(source, str):
+            return fitz.open(source)
+        return fitz.open(stream=source, filetype='pdf')
+
+    @staticmethod
+    def compress_pdf(file, profile=None):
+        """Compress PDF file, reusing the cached result for identical uploads.
+
+        profile picks a PDF_PROFILES entry (target image DPI and JPEG quality).
+        """
+        settings = Config.PDF_PROFILES[profile or Config.PDF_DEFAULT_PROFILE]
+        input_size = file.seek(0, os.SEEK_END)
+        key = ResultCache.key_for_file(file, PdfCompressionService._cache_params(settings))
+        cached = ResultCache.get(key)
+        if cached is not None:
+            logger.debug(f"Cache hit for file: {file.filename}")
+            metrics.record_transfer('pdf', input_size, len(cached))
+            return BytesIO(cached)
+
+        output = PdfCompressionService._compress_pdf(file, settings)
+        ResultCache.put(key, output.getvalue())
+        metrics.record_transfer('pdf', input_size, output.getbuffer().nbytes)
+        return output
+
+    @staticmethod
+    def _cache_params(settings):
+        """Parameters that affect the compressed output, for the result cache key"""
+        return {
+            'service': 'pdf',
+            'profile': settings,
+            'downsample_threshold': Config.PDF_DOWNSAMPLE_THRESHOLD,
+            'min_image_bytes': Config.PDF_MIN_IMAGE_BYTES,
+            'jpeg_quality_margin': Config.PDF_JPEG_QUALITY_MARGIN,
+        }
+
+    @staticmethod
+    def _compress_pdf(file, settings):
         """Compress PDF file using PyMuPDF with aggressive compression settings"""
         temp_path = None
         try:
-            # Create a temporary file to store the uploaded PDF
-            temp_path = os.path.join(Config.UPLOAD_FOLDER, 'temp.pdf')
-            file.save(temp_path)
+            # Open the PDF straight from the upload, spilling only large files to disk
+            with metrics.timer('pdf_open'):
+                source, original_bytes, temp_path = PdfCompressionService._load_upload(file)
+                doc = PdfCompressionService._open_source(source)
+            logger.debug("Successfully opened PDF file")
 
             # Get original file size
-            original_size = os.path.getsize(temp_path) / (1024 * 1024)  # Convert to MB
-            logger.info(f"Original PDF size: {original_size:.2f} MB")
-
-            # Open the PDF
-            doc = fitz.open(temp_path)
-            logger.info("Successfully opened PDF file")
+            original_size = original_bytes / (1024 * 1024)  # Convert to MB
+            logger.debug(f"Original PDF size: {original_size:.2f} MB")
             
-            # Create a new PDF with compression
             output = BytesIO()
-            new_doc = fitz.open()
-            logger.info("Created new PDF document")
-
-            # Process each page
-            for page_num, page in enumerate(doc):
-                logger.info(f"Processing page {page_num + 1}")
-                # Get the page
-                new_page = new_doc.new_page(width=page.rect.width, height=page.rect.height)
-                
-                # Get all images on the page
-                image_list = page.get_images()
-                logger.info(f"Found {len(image_list)} images on page {page_num + 1}")
-                
-                # Process each image
-                for img_index, img in enumerate(image_list):
+
+            # Collect every image xref once, however many pages share it
+            page_images = [[img[0] for img in page.get_images()] for page in doc]
+            xrefs = list(dict.fromkeys(xref for page_xrefs in page_images for xref in page_xrefs))
+            logger.debug(f"Found {len(xrefs)} unique images on {len(page_images)} pages")
+
+            # Pixel size each image needs at the profile's DPI, for those shown at a higher resolution
+            with metrics.timer('pdf_image_placement'):
+                target_sizes = PdfCompressionService._target_sizes(doc, settings['dpi'])
+
+            # Recompressed images by xref, None where skipped
+            image_cache = PdfCompressionService._recompress_images(doc, source, xrefs, target_sizes, settings['quality'])
+
+            # Rewrite the image objects in the document itself, so page trees,
+            # annotations, links and outlines are saved as they are
+            with metrics.timer('pdf_image_replace'):
+                for xref in xrefs:
+                    if image_cache.get(xref) is None:
+                        continue
                     try:
-                        xref = img[0]
-                        base_image = doc.extract_image(xref)
-                        image_bytes = base_image["image"]
-                        
-                        # Convert to PIL Image for processing
-                        image = Image.open(io.BytesIO(image_bytes))
-                        
-                        # Compress image
-                        img_byte_arr = io.BytesIO()
-                        image.save(img_byte_arr, format='JPEG', quality=30, optimize=True)
-                        img_byte_arr = img_byte_arr.getvalue()
-                        
-                        # Replace the image in the PDF
-                        new_doc.update_stream(xref, img_byte_arr)
-                        logger.info(f"Compressed image {img_index + 1} on page {page_num + 1}")
+                        PdfCompressionService._replace_image(doc, xref, image_cache[xref])
+                        logger.debug(f"Replaced image xref {xref}")
                     except Exception as img_error:
-                        logger.error(f"Error processing image {img_index + 1} on page {page_num + 1}: {str(img_error)}")
-                        continue
-                
-                # Copy page content
-                new_page.show_pdf_page(new_page.rect, doc, page.number)
-                
-                # Compress page content
-                new_page.clean_contents()
-                logger.info(f"Compressed page {page_num + 1} content")
-
-            logger.info("Starting final PDF compression")
-            # Set compression parameters (only supported ones)
-            new_doc.save(
-                output,
-                garbage=4,  # Maximum garbage collection
-                deflate=True,  # Use deflate compression
-                clean=True,  # Clean redundant elements
-                pretty=False,  # Don't pretty print
-                ascii=False,  # Use binary encoding
-                expand=0,  # Don't expand compressed objects
-            )
-            logger.info("Completed final PDF compression")
+                        logger.error(f"Error replacing image xref {xref}: {str(img_error)}")
 
-            # Close documents
+            logger.debug("Starting final PDF compression")
+            with metrics.timer('pdf_save'):
+                doc.save(
+                    output,
+                    garbage=4,  # Drop the replaced image data and merge duplicate objects
+                    deflate=True,  # Deflate streams that were stored uncompressed
+                    clean=True,  # Clean redundant elements
+                    pretty=False,  # Don't pretty print
+                    ascii=False,  # Use binary encoding
+                    expand=0,  # Don't expand compressed objects
+                )
+            logger.debug("Completed final PDF compression")
             doc.close()
-            new_doc.close()
 
             # Get compressed size
-            output.seek(0)
-            compressed_size = len(output.getvalue()) / (1024 * 1024)  # Convert to MB
-            logger.info(f"Compressed PDF size: {compressed_size:.2f} MB")
-            
+            compressed_size = output.getbuffer().nbytes / (1024 * 1024)  # Convert to MB
+            logger.debug(f"Compressed PDF size: {compressed_size:.2f} MB")
+
+            # If larger than original, return original PDF
+            if compressed_size >= original_size:
+                logger.debug("Compression did not reduce size, returning original PDF")
+                if isinstance(source, str):
+                    with open(source, 'rb') as source_file:
+                        return BytesIO(source_file.read())
+                return BytesIO(source)
+
             # Calculate compression ratio
             compression_ratio = (1 - (compressed_size / original_size)) * 100
-            logger.info(f"Compression ratio: {compression_ratio:.2f}%")
+            logger.debug(f"Compression ratio: {compression_ratio:.2f}%")
 
+            output.seek(0)
             return output
         except Exception as e:
             logger.error(f"Error compressing PDF: {str(e)}")
@@ -110,6 +166,201 @@ class PdfCompressionService:
                 try:
                     # Make sure file is not open before deleting
                     os.remove(temp_path)
-                    logger.info("Cleaned up temporary file")
+                    logger.debug("Cleaned up temporary file")
                 except Exception as cleanup_error:
-                    logger.error(f"Error cleaning up temporary file: {str(cleanup_error)}") 
\ No newline at end of file
+                    logger.error(f"Error cleaning up temporary file: {str(cleanup_error)}")
+
+    @staticmethod
+    def _target_sizes(doc, target_dpi, image_dpi=None):
+        """Map image xrefs to the (width, height) they need at target_dpi.
+
+        Images with no known placement, or within PDF_DOWNSAMPLE_THRESHOLD
+        of the target, are left out, and all of them when target_dpi is
+        None. image_dpi is a precomputed _image_dpi(doc) result.
+        """
+        if target_dpi is None:
+            return {}
+        dpi, sizes = image_dpi or PdfCompressionService._image_dpi(doc)
+        targets = {}
+        for xref, effective in dpi.items():
+            if effective > target_dpi * Config.PDF_DOWNSAMPLE_THRESHOLD:
+                width, height = sizes[xref]
+                scale = target_dpi / effective
+                targets[xref] = (max(1, round(width * scale)), max(1, round(height * scale)))
+                logger.debug(f"Image xref {xref} shown at {effective:.0f} DPI, downsampling to {targets[xref]}")
+        return targets
+
+    @staticmethod
+    def _image_dpi(doc):
+        """Return ({xref: effective DPI}, {xref: (width, height)}) for the images on pages.
+
+        The effective DPI of an image is taken from the largest placement
+        among all the pages showing it.
+        """
+        dpi = {}
+        sizes = {}
+        for page in doc:
+            page_images = page.get_images()
+            if not page_images:
+                # Text-only pages need no placement analysis
+                continue
+            # get_image_info without xrefs skips hashing every image, so placements
+            # are matched to xrefs by pixel size, keeping the highest DPI on a tie
+            shown_dpi = {}
+            for info in page.get_image_info():
+                a, b, c, d = info['transform'][:4]
+                # The transform maps the unit square to the placement, so its
+                # column lengths are the shown size in points, rotation included
+                shown_width = math.hypot(a, b) / 72
+                shown_height = math.hypot(c, d) / 72
+                if shown_width > 0 and shown_height > 0:
+                    size = (info['width'], info['height'])
+                    # Use the lower axis and the largest placement so nothing drops below target
+                    effective = min(size[0] / shown_width, size[1] / shown_height)
+                    shown_dpi[size] = max(shown_dpi.get(size, 0), effective)
+
+            for img in page_images:
+                xref, size = img[0], (img[2], img[3])
+                sizes[xref] = size
+                if size in shown_dpi:
+                    dpi[xref] = max(dpi.get(xref, 0), shown_dpi[size])
+        return dpi, sizes
+
+    @staticmethod
+    def _replace_image(doc, xref, result):
+        """Swap an image xref for a recompressed JPEG, updating its dictionary to match"""
+        data, width, height, mode = result
+        doc.update_stream(xref, data, compress=0)
+        doc.xref_set_key(xref, 'Filter', '/DCTDecode')
+        doc.xref_set_key(xref, 'Width', str(width))
+        doc.xref_set_key(xref, 'Height', str(height))
+        doc.xref_set_key(xref, 'BitsPerComponent', '8')
+        doc.xref_set_key(xref, 'ColorSpace', '/DeviceGray' if mode == 'L' else '/DeviceRGB')
+        doc.xref_set_key(xref, 'DecodeParms', 'null')
+        doc.xref_set_key(xref, 'Decode', 'null')
+        # A colour-key mask no longer matches exact colours after lossy encoding
+        if doc.xref_get_key(xref, 'Mask')[0] == 'array':
+            doc.xref_set_key(xref, 'Mask', 'null')
+
+    @staticmethod
+    def _recompress_images(doc, source, xrefs, target_sizes, quality):
+        """Recompress image xrefs, split across worker processes for large documents"""
+        executor = get_executor()
+        workers = min(Config.PDF_WORKERS, len(xrefs))
+        if executor is None or workers <= 1 or len(xrefs) < Config.PDF_PARALLEL_MIN_IMAGES:
+            return PdfCompressionService._recompress_xrefs(doc, xrefs, target_sizes, quality)
+
+        # Give each worker a contiguous range of xrefs
+        chunk_size = -(-len(xrefs) // workers)
+        futures = [
+            executor.submit(
+                PdfCompressionService._recompress_xref_range, source, xrefs[start:start + chunk_size],
+                {xref: target_sizes[xref] for xref in xrefs[start:start + chunk_size] if xref in target_sizes},
+                quality
+            )
+            for start in range(0, len(xrefs), chunk_size)
+        ]
+        logger.debug(f"Recompressing {len(xrefs)} images on {len(futures)} workers")
+
+        image_cache = {}
+        for future in futures:
+            image_cache.update(collect(future))
+        return image_cache
+
+    @staticmethod
+    def _recompress_xref_range(source, xrefs, target_sizes, quality):
+        """Worker entry point, opens its own copy of the document"""
+        doc = PdfCompressionService._open_source(source)
+        try:
+            return PdfCompressionService._recompress_xrefs(doc, xrefs, target_sizes, quality), metrics.drain()
+        finally:
+            doc.close()
+
+    @staticmethod
+    def _recompress_xrefs(doc, xrefs, target_sizes, quality):
+        """Recompress each xref, mapping it to (stream, width, height, mode) or None"""
+        image_cache = {}
+        for xref in xrefs:
+            try:
+                with metrics.timer('pdf_image_recompress'):
+                    image_cache[xref] = PdfCompressionService._recompress_image(doc, xref, target_sizes.get(xref), quality)
+            except Exception as img_error:
+                image_cache[xref] = None
+                logger.error(f"Error processing image xref {xref}: {str(img_error)}")
+        return image_cache
+
+    @staticmethod
+    def _skip_image(doc, xref, raw_stream, target_size, quality):
+        """Whether an image xref is left as it is, from its dictionary and header only.
+
+        Images that need no downsampling are only re-encoded when that lowers
+        their quality, a JPEG already near quality is kept byte for byte.
+        """
+        # Skip images that are already small, and stencil masks which must stay 1-bit
+        if len(raw_stream) < Config.PDF_MIN_IMAGE_BYTES and target_size is None:
+            logger.debug(f"Skipping image xref {xref}: only {len(raw_stream)} bytes")
+            return True
+        if doc.xref_get_key(xref, 'ImageMask') == ('bool', 'true'):
+            return True
+
+        if target_size is None and doc.xref_get_key(xref, 'Filter') == ('name', '/DCTDecode'):
+            # The raw stream is a JPEG file; check its quality from the header alone
+            source_quality = QualityPredictor.estimate_jpeg_quality(Image.open(io.BytesIO(raw_stream)))
+            if source_quality is not None and source_quality <= quality + Config.PDF_JPEG_QUALITY_MARGIN:
+                logger.debug(f"Skipping image xref {xref}: already JPEG at quality ~{source_quality}")
+                return True
+        return False
+
+    @staticmethod
+    def _decode_image(doc, xref, raw_stream, target_size=None):
+        """Decode an image xref to RGB or L, letting RGB and gray JPEG streams scale towards target_size"""
+        if doc.xref_get_key(xref, 'Filter') == ('name', '/DCTDecode'):
+            image = Image.open(io.BytesIO(raw_stream))
+            if image.mode in ('RGB', 'L'):
+                if target_size is not None:
+                    # Let the decoder scale by 1/2, 1/4 or 1/8 on the way in
+                    image.draft(image.mode, target_size)
+                return ImageNormalizer.flatten(image)
+            # CMYK and YCCK need MuPDF's colour management and the PDF's Decode array,
+            # Pillow's plain CMYK conversion comes out too dark
+
+        try:
+            # Decode straight to pixels, extract_image would re-encode them as PNG first
+            pixmap = fitz.Pixmap(doc, xref)
+            if pixmap.alpha:
+                pixmap = fitz.Pixmap(pixmap, 0)
+            if pixmap.n not in (1, 3):
+                # CMYK and other colour spaces are converted by MuPDF
+                pixmap = fitz.Pixmap(fitz.csRGB, pixmap)
+            image = Image.frombytes('L' if pixmap.n == 1 else 'RGB', (pixmap.width, pixmap.height), pixmap.samples)
+        except Exception as e:
+            logger.debug(f"Pixmap decode failed for xref {xref} ({e}), extracting instead")
+            image = Image.open(io.BytesIO(doc.extract_image(xref)["image"]))
+        return ImageNormalizer.flatten(image)
+
+    @staticmethod
+    def _recompress_image(doc, xref, target_size, quality):
+        """Re-encode an image xref as JPEG, downsampled to target_size when given.
+
+        Returns (stream, width, height, mode), or None when it is not worth it.
+        """
+        raw_stream = doc.xref_stream_raw(xref)
+        if PdfCompressionService._skip_image(doc, xref, raw_stream, target_size, quality):
+            return None
+
+        image = PdfCompressionService._decode_image(doc, xref, raw_stream, target_size)
+
+        if target_size is not None and image.size != target_size:
+            image = image.resize(target_size, Image.Resampling.LANCZOS, reducing_gap=Config.RESIZE_REDUCING_GAP)
+
+        # Compress image
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format='JPEG', quality=quality, optimize=True)
+        img_byte_arr = img_byte_arr.getvalue()
+
+        # Skip images that would grow when re-encoded
+        if len(img_byte_arr) >= len(raw_stream):
+            logger.debug(f"Skipping image xref {xref}: re-encoding would not reduce size")
+            return None
+
+        return img_byte_arr, image.width, image.height, image.mode
@@ -0,0 +1,112 @@
+import io
+import logging
+import fitz  # PyMuPDF
+from PIL import Image
+from config.settings import Config
+from services.image_normalizer import ImageNormalizer
+from services.image_strips import ImageStrips, StripReader
+from utils import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class PdfConversionService:
+    # Standard width for all images (A4 width in pixels at 200 DPI)
+    STANDARD_WIDTH = 1654  # A4 width at 200 DPI
+    MARGIN = 50  # Margin in pixels (25px * 2 for 200 DPI)
+
+    @staticmethod
+    def images_to_pdf(files):
+        """Convert uploaded images into a single PDF, one image per page.
+
+        Pages are added one at a time so only one decoded image is held in
+        memory. Raises ValueError when none of the files is a usable image.
+        """
+        standard_width = PdfConversionService.STANDARD_WIDTH
+        margin = PdfConversionService.MARGIN
+        content_width = standard_width - (2 * margin)
+
+        # Page geometry in points, matching the previous 200 DPI output
+        points_per_pixel = 72 / Config.JPG_TO_PDF_DPI
+
+        doc = fitz.open()
+        try:
+            # Process each image
+            for file in files:
+                if file.filename == '':
+                    continue
+
+                with metrics.timer('convert_page'):
+                    # Read the image header
+                    img = Image.open(file.stream)
+
+                    # Calculate new height maintaining aspect ratio
+                    aspect_ratio = img.height / img.width
+                    new_height = int(content_width * aspect_ratio)
+
+                    page = doc.new_page(
+                        width=standard_width * points_per_pixel,
+                        height=(new_height + (2 * margin)) * points_per_pixel
+                    )
+                    rect = fitz.Rect(
+                        margin * points_per_pixel,
+                        margin * points_per_pixel,
+                        (margin + content_width) * points_per_pixel,
+                        (margin + new_height) * points_per_pixel
+                    )
+
+                    if PdfConversionService._can_embed(img):
+                        # Embed the original DCT stream, no decode or re-encode
+                        file.stream.seek(0)
+                        page.insert_image(rect, stream=file.stream.read())
+                        logger.debug(f"Embedded {file.filename} without re-encoding")
+                    else:
+                        page.insert_image(rect, stream=PdfConversionService._encode_page_image(img, content_width, new_height))
+                    img.close()
+
+            if doc.page_count == 0:
+                raise ValueError('No valid image files were provided')
+
+            # Create PDF in memory
+            pdf_buffer = io.BytesIO()
+            with metrics.timer('convert_save'):
+                doc.save(pdf_buffer, garbage=1, deflate=True)
+            logger.debug(f"Converted {doc.page_count} images to PDF")
+        finally:
+            doc.close()
+        
+        # Reset buffer position
+        pdf_buffer.seek(0)
+        return pdf_buffer
+
+    @staticmethod
+    def _can_embed(img):
+        """Whether a JPEG can go into the PDF as-is"""
+        return (
+            img.format == 'JPEG'
+            and img.mode in ('RGB', 'L')
+            and img.width <= Config.JPG_TO_PDF_EMBED_MAX_WIDTH
+        )
+
+    @staticmethod
+    def _encode_page_image(img, width, height):
+        """Flatten, resize and JPEG-encode one page image"""
+        # Let JPEGs decode at a reduced DCT scale close to the target size
+        if img.format == 'JPEG' and img.width > width:
+            img.draft(img.mode, (width, height))
+
+        if ImageStrips.should_tile(img):
+            # Flatten and resize a strip of rows at a time, only the page-sized result is held
+            strips = ((top, ImageNormalizer.flatten(strip)) for top, strip in StripReader(img).strips())
+            img = ImageStrips.assemble(ImageStrips.resize(strips, img.size, (width, height)), (width, height))
+        else:
+            # Flatten transparency onto white and bring other modes to RGB or L
+            img = ImageNormalizer.flatten(img)
+
+            # Resize image with high quality
+            img = img.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=Config.RESIZE_REDUCING_GAP)
+
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=90)
+        return output.getvalue()
@@ -0,0 +1,129 @@
+import logging
+from io import BytesIO
+from PIL import Image
+from config.settings import Config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class QualityPredictor:
+    """Predict encoder settings for a target size from a small sample encode"""
+
+    # IJG standard luminance quantization table, quality 50 (JPEG Annex K)
+    STANDARD_LUMINANCE_TABLE = [
+        16, 11, 10, 16, 24, 40, 51, 61,
+        12, 12, 14, 19, 26, 58, 60, 55,
+        14, 13, 16, 24, 40, 57, 69, 56,
+        14, 17, 22, 29, 51, 87, 80, 62,
+        18, 22, 37, 56, 68, 109, 103, 77,
+        24, 35, 55, 64, 81, 104, 113, 92,
+        49, 64, 78, 87, 103, 121, 120, 101,
+        72, 92, 95, 98, 112, 100, 103, 99,
+    ]
+
+    # Tiles are aligned to 16 px so JPEG blocks (including 4:2:0 chroma) in the
+    # sample are identical to the blocks of the full image
+    BLOCK_ALIGN = 16
+
+    @staticmethod
+    def build_sample(image, size=None):
+        """Build a mosaic of tiles taken across the image.
+
+        Returns the sample and the ratio between full and sample pixel counts.
+        Small images are used as-is with a ratio of 1. With size, the image
+        is sampled as if resized to size, resizing only the sampled tiles.
+        """
+        tile = Config.IMAGE_SAMPLE_TILE
+        grid = Config.IMAGE_SAMPLE_GRID
+        width, height = size or image.size
+        sample_pixels = (tile * grid) ** 2
+
+        if width * height <= sample_pixels * 2 or width < tile * 2 or height < tile * 2:
+            if size is not None and size != image.size:
+                image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=Config.RESIZE_REDUCING_GAP)
+            return image, 1.0
+
+        def positions(length):
+            last = length - tile
+            align = QualityPredictor.BLOCK_ALIGN
+            return [(last * i // (grid - 1)) // align * align for i in range(grid)]
+
+        sample = Image.new(image.mode, (tile * grid, tile * grid))
+        if image.mode == 'P':
+            sample.putpalette(image.getpalette())
+
+        scale_x, scale_y = image.size[0] / width, image.size[1] / height
+        for row, y in enumerate(positions(height)):
+            for col, x in enumerate(positions(width)):
+                if size is None:
+                    region = image.crop((x, y, x + tile, y + tile))
+                else:
+                    box = (x * scale_x, y * scale_y, (x + tile) * scale_x, (y + tile) * scale_y)
+                    region = image.resize((tile, tile), Image.Resampling.LANCZOS, box=box)
+                sample.paste(region, (col * tile, row * tile))
+
+        return sample, (width * height) / sample_pixels
+
+    @staticmethod
+    def encode(image, output_format, quality=None, **params):
+        """Encode image and return the resulting bytes, JPEGs with optimized Huffman tables unless optimize=False"""
+        output = BytesIO()
+        if output_format == 'JPEG':
+            image.save(output, format='JPEG', quality=quality, **{'optimize': True, **params})
+        elif quality is not None:
+            image.save(output, format=output_format, quality=quality, **params)
+        else:
+            image.save(output, format=output_format, **params)
+        return output.getvalue()
+
+    @staticmethod
+    def estimate_size(sample, scale, output_format, quality=None, **params):
+        """Estimate the full-resolution encoded size in bytes from the sample"""
+        sample_size = len(QualityPredictor.encode(sample, output_format, quality, **params))
+        if scale == 1.0:
+            return sample_size
+
+        # Headers and tables do not scale with the pixel count
+        blank = Image.new(sample.mode, (QualityPredictor.BLOCK_ALIGN, QualityPredictor.BLOCK_ALIGN))
+        if sample.mode == 'P':
+            blank.putpalette(sample.getpalette())
+        overhead = len(QualityPredictor.encode(blank, output_format, quality, **params))
+        return overhead + max(sample_size - overhead, 0) * scale
+
+    @staticmethod
+    def predict_quality(sample, scale, target_bytes, min_quality, max_quality, output_format='JPEG', **params):
+        """Bisect over quality for the highest value predicted to fit target_bytes.
+
+        Keyword params are encoder options, such as the WebP method.
+        """
+        low, high = min_quality, max_quality
+        best = min_quality
+        while low <= high:
+            mid = (low + high) // 2
+            estimate = QualityPredictor.estimate_size(sample, scale, output_format, mid, **params)
+            logger.debug(f"Predicted size at quality {mid}: {estimate / (1024 * 1024):.2f} MB")
+            if estimate <= target_bytes:
+                best = mid
+                low = mid + 1
+            else:
+                high = mid - 1
+        return best
+
+    @staticmethod
+    def estimate_jpeg_quality(image):
+        """Estimate the IJG quality a JPEG was saved with from its quantization tables.
+
+        Only the header is read, the image is not decoded. Returns None when
+        the tables are not available.
+        """
+        tables = getattr(image, 'quantization', None)
+        if not tables or 0 not in tables:
+            return None
+
+        scale = sum(tables[0]) * 100 / sum(QualityPredictor.STANDARD_LUMINANCE_TABLE)
+        if scale <= 100:
+            quality = (200 - scale) / 2
+        else:
+            quality = 5000 / scale
+        return max(1, min(100, round(quality)))
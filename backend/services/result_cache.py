@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from config.settings import Config
+from utils import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """Content-addressed cache of compression results.
+
+    Entries are keyed by a hash of the input bytes plus the parameters that
+    affect the output. A size-bounded in-memory LRU sits in front of an
+    optional on-disk tier under RESULT_CACHE_FOLDER that is shared by all
+    worker processes.
+    """
+
+    _memory = OrderedDict()
+    _memory_bytes = 0
+    _lock = threading.Lock()
+    _counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def key_for_file(file, params):
+        """Hash an upload's bytes and the effective parameters, leaving the file at 0"""
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+        file.seek(0)
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+        file.seek(0)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _count(name):
+        with ResultCache._lock:
+            ResultCache._counters[name] += 1
+        metrics.increment('yukomp_result_cache_events_total', event=name)
+
+    @staticmethod
+    def get(key):
+        """Return cached bytes for key, or None"""
+        if Config.RESULT_CACHE_MEMORY_BYTES > 0:
+            with ResultCache._lock:
+                data = ResultCache._memory.get(key)
+                if data is not None:
+                    ResultCache._memory.move_to_end(key)
+            if data is not None:
+                ResultCache._count('memory_hits')
+                return data
+
+        if Config.RESULT_CACHE_DISK_BYTES > 0:
+            path = os.path.join(Config.RESULT_CACHE_FOLDER, key)
+            try:
+                with open(path, 'rb') as cached_file:
+                    data = cached_file.read()
+                # Refresh mtime so disk eviction is least recently used
+                os.utime(path)
+            except FileNotFoundError:
+                data = None
+            if data is not None:
+                ResultCache._count('disk_hits')
+                ResultCache._store_memory(key, data)
+                return data
+
+        ResultCache._count('misses')
+        return None
+
+    @staticmethod
+    def put(key, data):
+        """Store result bytes in every enabled tier"""
+        ResultCache._count('stores')
+        ResultCache._store_memory(key, data)
+        if Config.RESULT_CACHE_DISK_BYTES > 0:
+            ResultCache._store_disk(key, data)
+
+    @staticmethod
+    def _store_memory(key, data):
+        budget = Config.RESULT_CACHE_MEMORY_BYTES
+        # Items larger than a quarter of the budget would flush everything else
+        if len(data) > budget // 4:
+            return
+        evictions = 0
+        with ResultCache._lock:
+            if key in ResultCache._memory:
+                ResultCache._memory.move_to_end(key)
+                return
+            ResultCache._memory[key] = data
+            ResultCache._memory_bytes += len(data)
+            while ResultCache._memory_bytes > budget:
+                _, evicted = ResultCache._memory.popitem(last=False)
+                ResultCache._memory_bytes -= len(evicted)
+                evictions += 1
+        for _ in range(evictions):
+            ResultCache._count('evictions')
+
+    @staticmethod
+    def _store_disk(key, data):
+        budget = Config.RESULT_CACHE_DISK_BYTES
+        if len(data) > budget:
+            return
+        folder = Config.RESULT_CACHE_FOLDER
+        os.makedirs(folder, exist_ok=True)
+        try:
+            # Write then rename so other processes never read a partial entry
+            fd, temp_path = tempfile.mkstemp(dir=folder, prefix='.tmp')
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, os.path.join(folder, key))
+
+            entries = []
+            for entry in os.scandir(folder):
+                if entry.is_file() and not entry.name.startswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            used = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if used <= budget:
+                    break
+                os.remove(path)
+                used -= size
+                ResultCache._count('evictions')
+        except OSError as e:
+            logger.error(f"Error writing result cache entry: {str(e)}")
+
+    @staticmethod
+    def stats():
+        """Return a copy of the hit/miss counters and memory tier usage"""
+        with ResultCache._lock:
+            stats = dict(ResultCache._counters)
+            stats['memory_entries'] = len(ResultCache._memory)
+            stats['memory_bytes'] = ResultCache._memory_bytes
+        return stats
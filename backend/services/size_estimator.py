@@ -0,0 +1,214 @@
+import os
+import hashlib
+import logging
+from PIL import Image
+from config.settings import Config
+from services.image_compression_service import ImageCompressionService
+from services.image_normalizer import ImageNormalizer
+from services.pdf_compression_service import PdfCompressionService
+from services.quality_predictor import QualityPredictor
+from utils import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SizeEstimator:
+    """Predict compressed sizes for previews without running the full compression.
+
+    Images are estimated from the same tile samples the compressors use to
+    pick their settings. PDFs combine the image xref table with sampled
+    recompressions of their largest images and extrapolate to the rest.
+    """
+
+    @staticmethod
+    def _option(original_bytes, size, **option):
+        # The services return the original when compression does not help
+        size = int(min(size, original_bytes))
+        return {**option, 'size': size, 'ratio': round(size / original_bytes, 4) if original_bytes else 1.0}
+
+    @staticmethod
+    def estimate_image(file):
+        """Return predicted sizes per JPEG quality or PNG effort, plus the default run"""
+        original_bytes = file.seek(0, os.SEEK_END)
+        file.seek(0)
+        _, target_bytes = ImageCompressionService.size_target(original_bytes)
+
+        with metrics.timer('estimate_decode'):
+            image = Image.open(file)
+            full_size = image.size
+            pixels = full_size[0] * full_size[1]
+            if pixels > Config.ESTIMATE_DECODE_PIXELS:
+                # JPEGs decode at a reduced scale, other formats ignore the draft
+                ratio = (Config.ESTIMATE_DECODE_PIXELS / pixels) ** 0.5
+                image.draft(image.mode, (int(full_size[0] * ratio), int(full_size[1] * ratio)))
+            image.load()
+
+        if file.filename.lower().endswith('.png'):
+            options = SizeEstimator._estimate_png(ImageNormalizer.for_png(image), original_bytes, target_bytes)
+            default = next(option for option in options if option['effort'] == Config.PNG_DEFAULT_EFFORT)
+            return {'format': 'PNG', 'original_size': original_bytes, 'options': options, 'default': default}
+
+        options, default = SizeEstimator._estimate_jpeg(ImageNormalizer.flatten(image), full_size, original_bytes, target_bytes)
+        return {'format': 'JPEG', 'original_size': original_bytes, 'options': options, 'default': default}
+
+    @staticmethod
+    def _estimate_jpeg(image, full_size, original_bytes, target_bytes):
+        """Sample encodes at each reported quality and at the quality compress_image would pick.
+
+        image may be a reduced decode, its sample is scaled up to full_size.
+        """
+        default_quality, _ = ImageCompressionService.size_target(original_bytes)
+        sample, scale = QualityPredictor.build_sample(image)
+        scale *= (full_size[0] * full_size[1]) / (image.width * image.height)
+        with metrics.timer('estimate_encode'):
+            options = [
+                SizeEstimator._option(original_bytes, QualityPredictor.estimate_size(sample, scale, 'JPEG', quality), quality=quality)
+                for quality in Config.ESTIMATE_JPEG_QUALITIES
+            ]
+            quality = QualityPredictor.predict_quality(sample, scale, target_bytes, Config.IMAGE_MIN_QUALITY, default_quality)
+            default = SizeEstimator._option(
+                original_bytes, QualityPredictor.estimate_size(sample, scale, 'JPEG', quality), quality=quality
+            )
+        return options, default
+
+    @staticmethod
+    def _estimate_png(image, original_bytes, target_bytes):
+        """Follow compress_image's level choice, then sample the chosen levels at each effort.
+
+        Only tile samples are processed, never the whole image: the sample's
+        colours stand in for the image's when planning, and downscaled levels
+        are sampled from resized tiles. The level is planned once at the
+        default effort, efforts only change the zlib level.
+        """
+        sample, scale = QualityPredictor.build_sample(image)
+        palette = None
+        if sample.mode in ('RGB', 'RGBA'):
+            with metrics.timer('png_color_count'):
+                colors = sample.getcolors(256)
+            if colors is not None:
+                # Never applied to the image, prepare() quantizes the sample to this many colours
+                palette = (None, len(colors), Image.Quantize.FASTOCTREE)
+        levels, start, prepare = ImageCompressionService._plan_png(
+            image, palette, target_bytes, Config.PNG_DEFAULT_EFFORT, sample=(sample, scale)
+        )
+        width, height = image.size
+        samples = {}  # level -> (sample, scale) at that level
+
+        options = []
+        with metrics.timer('estimate_encode'):
+            for effort, (truecolor_level, palette_level) in Config.PNG_EFFORT_LEVELS.items():
+                size = None
+                # Take the first level from the planned one that fits, as the plan for
+                # a cheaper zlib level would start further down the ladder
+                for max_dimension, colors in levels[start:]:
+                    level = (max_dimension, colors)
+                    if level not in samples:
+                        level_sample, level_scale = sample, scale
+                        if max_dimension is not None:
+                            # A downscale packs more detail into each pixel, so only the
+                            # sampled tiles are resized rather than scaling the bytes
+                            ratio = min(max_dimension / width, max_dimension / height)
+                            level_sample, level_scale = QualityPredictor.build_sample(
+                                image, size=(int(width * ratio), int(height * ratio))
+                            )
+                        samples[level] = (prepare(level_sample, None, colors), level_scale)
+                    level_sample, level_scale = samples[level]
+                    estimate = QualityPredictor.estimate_size(
+                        level_sample, level_scale, 'PNG',
+                        compress_level=palette_level if level_sample.mode == 'P' else truecolor_level
+                    )
+                    size = estimate if size is None else min(size, estimate)
+                    if estimate <= target_bytes:
+                        break
+                options.append(SizeEstimator._option(original_bytes, size, effort=effort))
+        return options
+
+    @staticmethod
+    def estimate_pdf(file):
+        """Return predicted sizes per PDF profile, plus the default profile"""
+        source, original_bytes, temp_path = PdfCompressionService._load_upload(file)
+        try:
+            doc = PdfCompressionService._open_source(source)
+            try:
+                sizes = SizeEstimator._estimate_profiles(doc, original_bytes)
+            finally:
+                doc.close()
+        finally:
+            if temp_path:
+                os.remove(temp_path)
+
+        options = [SizeEstimator._option(original_bytes, size, profile=name) for name, size in sizes.items()]
+        default = next(option for option in options if option['profile'] == Config.PDF_DEFAULT_PROFILE)
+        return {'format': 'PDF', 'original_size': original_bytes, 'options': options, 'default': default}
+
+    @staticmethod
+    def _estimate_profiles(doc, original_bytes):
+        """Predict the output bytes of every profile.
+
+        The largest image streams are decoded once and estimated per profile
+        from a tile sample taken as if downsampled to the profile's size.
+        Their output bytes per pixel are applied to the other images a
+        profile would recompress.
+        Everything else is taken as the file size less the candidate image
+        streams, without saving the document.
+        """
+        with metrics.timer('pdf_image_placement'):
+            image_dpi = PdfCompressionService._image_dpi(doc)
+            targets = {
+                name: PdfCompressionService._target_sizes(doc, settings['dpi'], image_dpi)
+                for name, settings in Config.PDF_PROFILES.items()
+            }
+
+        # digest -> (xref, stream bytes, width, height) for every image some profile would
+        # consider, identical streams once as the final save merges them
+        images = {}
+        seen = set()
+        image_stream_bytes = 0  # Every candidate xref, duplicates included as the final save merges them
+        for page in doc:
+            for img in page.get_images():
+                xref = img[0]
+                if xref in seen:
+                    continue
+                seen.add(xref)
+                raw_stream = doc.xref_stream_raw(xref)
+                if len(raw_stream) >= Config.PDF_MIN_IMAGE_BYTES or any(xref in sizes for sizes in targets.values()):
+                    images.setdefault(hashlib.sha1(raw_stream).digest(), (xref, len(raw_stream), img[2], img[3]))
+                    image_stream_bytes += len(raw_stream)
+
+        candidates = sorted(images.values(), key=lambda entry: entry[1], reverse=True)
+        sampled, rest = candidates[:Config.ESTIMATE_PDF_SAMPLE_IMAGES], candidates[Config.ESTIMATE_PDF_SAMPLE_IMAGES:]
+
+        # profile -> [bytes out, output pixels] over the sampled images
+        totals = {name: [0, 0] for name in Config.PDF_PROFILES}
+        with metrics.timer('estimate_encode'):
+            for xref, stream_bytes, width, height in sampled:
+                raw_stream = doc.xref_stream_raw(xref)
+                image = None
+                for name, settings in Config.PDF_PROFILES.items():
+                    target_size = targets[name].get(xref)
+                    size = stream_bytes
+                    if not PdfCompressionService._skip_image(doc, xref, raw_stream, target_size, settings['quality']):
+                        if image is None:
+                            image = PdfCompressionService._decode_image(doc, xref, raw_stream)
+                        # Only the sampled tiles are downsampled
+                        sample, scale = QualityPredictor.build_sample(image, target_size)
+                        # Images that would grow keep their stream
+                        size = min(size, QualityPredictor.estimate_size(sample, scale, 'JPEG', settings['quality']))
+                    output_width, output_height = target_size or (width, height)
+                    totals[name][0] += size
+                    totals[name][1] += output_width * output_height
+
+        # Everything but the candidate images, as stored in the upload
+        structure_bytes = max(original_bytes - image_stream_bytes, 0)
+
+        sizes = {}
+        for name, (sampled_out, sampled_pixels) in totals.items():
+            bytes_per_pixel = sampled_out / sampled_pixels if sampled_pixels else 0
+            rest_out = 0
+            for xref, stream_bytes, width, height in rest:
+                width, height = targets[name].get(xref, (width, height))
+                rest_out += min(stream_bytes, width * height * bytes_per_pixel)
+            sizes[name] = structure_bytes + sampled_out + rest_out
+            logger.debug(f"Profile {name}: sampled {len(sampled)} of {len(candidates)} images, structure {structure_bytes} bytes")
+        return sizes
@@ -0,0 +1,254 @@
+import os
+import json
+import uuid
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from config.settings import Config
+from services.job_service import JobService
+from utils import metrics
+from utils.file_utils import allowed_file
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Bytes read from the request body per write
+BLOCK_SIZE = 1024 * 1024
+
+class UploadError(Exception):
+    """Raised when an upload or chunk is rejected, carrying the HTTP status and current offset"""
+
+    def __init__(self, message, status_code, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+class UploadService:
+    """Resumable chunked uploads for files above MAX_CONTENT_LENGTH.
+
+    Chunks are raw request bodies appended at an explicit offset to a spool
+    file under CHUNKED_UPLOAD_FOLDER, hashing as they stream in. Upload
+    records live in SQLite so a chunk can land on any worker process. Once
+    the last chunk arrives the spool is handed to a background job as-is.
+    """
+
+    # Columns added after the first release, created on databases that predate them
+    ADDED_COLUMNS = {'options': 'TEXT'}
+
+    # upload id -> (bytes hashed, sha256 object) for chunks written by this process
+    _hashers = {}
+    _hashers_lock = threading.Lock()
+
+    @staticmethod
+    def _connect():
+        os.makedirs(Config.CHUNKED_UPLOAD_FOLDER, exist_ok=True)
+        connection = sqlite3.connect(os.path.join(Config.CHUNKED_UPLOAD_FOLDER, 'uploads.sqlite3'), timeout=10)
+        connection.row_factory = sqlite3.Row
+        connection.execute('''
+            CREATE TABLE IF NOT EXISTS uploads (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                sha256 TEXT,
+                digest TEXT,
+                job_id TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                options TEXT
+            )
+        ''')
+        existing = {row['name'] for row in connection.execute('PRAGMA table_info(uploads)')}
+        for name, definition in UploadService.ADDED_COLUMNS.items():
+            if name not in existing:
+                try:
+                    connection.execute(f'ALTER TABLE uploads ADD COLUMN {name} {definition}')
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+        return connection
+
+    @staticmethod
+    def _update(upload_id, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with UploadService._connect() as connection:
+            connection.execute(f'UPDATE uploads SET {assignments} WHERE id = ?', (*fields.values(), upload_id))
+
+    @staticmethod
+    def spool_path(upload_id):
+        return os.path.join(Config.CHUNKED_UPLOAD_FOLDER, f'{upload_id}.part')
+
+    @staticmethod
+    def create(kind, filename, size, sha256=None, options=None):
+        """Start an upload of size bytes, returning its record.
+
+        options are the compression options of the job queued once the
+        upload is complete.
+        """
+        UploadService.expire()
+
+        if kind not in JobService.COMPRESSION_KINDS:
+            raise UploadError(f'Unknown upload type: {kind}', 404)
+        if not filename or not allowed_file(filename, JobService.COMPRESSION_KINDS[kind][0]):
+            raise UploadError('File type not allowed', 400)
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError('size must be a positive number of bytes', 400)
+        if size > Config.CHUNKED_UPLOAD_MAX_BYTES:
+            raise UploadError(f'File is larger than {Config.CHUNKED_UPLOAD_MAX_BYTES} bytes', 413)
+
+        upload_id = uuid.uuid4().hex
+        open(UploadService.spool_path(upload_id), 'wb').close()
+
+        now = time.time()
+        with UploadService._connect() as connection:
+            connection.execute(
+                'INSERT INTO uploads (id, kind, filename, size, offset, status, sha256, created_at, updated_at, options) '
+                'VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, ?)',
+                (upload_id, kind, filename, size, 'open', sha256.lower() if sha256 else None, now, now,
+                 json.dumps(options or {}))
+            )
+        logger.info(f"Started {kind} upload {upload_id}, {size / (1024 * 1024):.2f} MB")
+        return UploadService.get(upload_id)
+
+    @staticmethod
+    def get(upload_id):
+        """Return the upload record as a dict, or None if unknown or expired"""
+        with UploadService._connect() as connection:
+            row = connection.execute('SELECT * FROM uploads WHERE id = ?', (upload_id,)).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _hasher(upload_id, path, offset):
+        """Return a sha256 of the spool's first offset bytes, reusing this process's running hash"""
+        with UploadService._hashers_lock:
+            hashed, hasher = UploadService._hashers.pop(upload_id, (0, None))
+        if hasher is None or hashed > offset:
+            hashed, hasher = 0, hashlib.sha256()
+
+        # Catch up on chunks another worker process wrote
+        remaining = offset - hashed
+        if remaining:
+            with open(path, 'rb') as spool:
+                spool.seek(hashed)
+                while remaining:
+                    block = spool.read(min(BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    hasher.update(block)
+                    remaining -= len(block)
+        return hasher
+
+    @staticmethod
+    def append(upload_id, offset, stream, length):
+        """Write length bytes from stream at offset, queueing the job after the last chunk.
+
+        Returns the updated record. A chunk whose offset is not the current
+        end of the upload is rejected with the offset to resume from.
+        """
+        upload = UploadService.get(upload_id)
+        if upload is None:
+            raise UploadError('Upload not found or expired', 404)
+
+        if upload['status'] == 'complete':
+            # An empty final chunk retries queueing, e.g. after the job queue was full
+            if upload['job_id'] is None and offset == upload['size'] and length == 0:
+                return UploadService._finish(upload)
+            raise UploadError('Upload is already complete', 409, upload['offset'])
+        if offset != upload['offset']:
+            raise UploadError('Upload-Offset does not match the uploaded size', 409, upload['offset'])
+        if offset + length > upload['size']:
+            raise UploadError('Chunk runs past the declared size', 400, upload['offset'])
+        if length == 0:
+            return upload
+
+        # Claim the upload so two chunks cannot interleave, taking over claims left by dead writers
+        now = time.time()
+        with UploadService._connect() as connection:
+            claimed = connection.execute(
+                "UPDATE uploads SET status = 'writing', updated_at = ? "
+                "WHERE id = ? AND offset = ? AND (status = 'open' OR (status = 'writing' AND updated_at < ?))",
+                (now, upload_id, offset, now - Config.CHUNKED_UPLOAD_LOCK_TIMEOUT)
+            ).rowcount
+        if not claimed:
+            raise UploadError('Another chunk is being written', 409, offset)
+
+        path = UploadService.spool_path(upload_id)
+        written = 0
+        try:
+            hasher = UploadService._hasher(upload_id, path, offset)
+            with metrics.timer('upload_chunk'), open(path, 'r+b') as spool:
+                spool.seek(offset)
+                while written < length:
+                    block = stream.read(min(BLOCK_SIZE, length - written))
+                    if not block:
+                        break
+                    spool.write(block)
+                    hasher.update(block)
+                    written += len(block)
+                if written < length:
+                    # The client went away mid-chunk, keep the spool at the last whole chunk
+                    spool.truncate(offset)
+        except Exception:
+            with open(path, 'r+b') as spool:
+                spool.truncate(offset)
+            UploadService._update(upload_id, status='open')
+            raise
+
+        if written < length:
+            UploadService._update(upload_id, status='open')
+            raise UploadError('Chunk ended before Content-Length bytes were received', 400, offset)
+
+        new_offset = offset + written
+        if new_offset < upload['size']:
+            with UploadService._hashers_lock:
+                UploadService._hashers[upload_id] = (new_offset, hasher)
+            UploadService._update(upload_id, offset=new_offset, status='open')
+            return UploadService.get(upload_id)
+
+        UploadService._update(upload_id, offset=new_offset, status='complete', digest=hasher.hexdigest())
+        logger.info(f"Upload {upload_id} complete")
+        return UploadService._finish(UploadService.get(upload_id))
+
+    @staticmethod
+    def _finish(upload):
+        """Verify a complete upload and hand its spool to a compression job"""
+        if upload['sha256'] and upload['sha256'] != upload['digest']:
+            UploadService.delete(upload['id'])
+            raise UploadError('sha256 of the received file does not match, upload discarded', 422)
+
+        job = JobService.submit_spooled(
+            upload['kind'], upload['filename'], UploadService.spool_path(upload['id']),
+            json.loads(upload['options'] or '{}')
+        )
+        UploadService._update(upload['id'], job_id=job['id'])
+        return UploadService.get(upload['id'])
+
+    @staticmethod
+    def delete(upload_id):
+        """Drop an upload and its spool"""
+        with UploadService._hashers_lock:
+            UploadService._hashers.pop(upload_id, None)
+        with UploadService._connect() as connection:
+            connection.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+        try:
+            os.remove(UploadService.spool_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def expire():
+        """Delete uploads untouched for CHUNKED_UPLOAD_TTL seconds"""
+        with UploadService._connect() as connection:
+            expired = [row['id'] for row in connection.execute(
+                'SELECT id FROM uploads WHERE updated_at < ?', (time.time() - Config.CHUNKED_UPLOAD_TTL,)
+            )]
+        for upload_id in expired:
+            UploadService.delete(upload_id)
+        if expired:
+            logger.info(f"Expired {len(expired)} uploads")
@@ -0,0 +1,65 @@
+"""Scans too large to decode whole are admitted when they are read in strips.
+
+Run from backend/: python -m pytest tests
+"""
+import io
+import zlib
+import struct
+import pytest
+from PIL import Image
+from config.settings import Config
+from services.image_strips import PNG_SIGNATURE, _png_chunk
+from utils import admission
+
+SIZE = 10240  # 105 MP, above ADMISSION_MAX_IMAGE_PIXELS
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(Config, 'RESULT_CACHE_MEMORY_BYTES', 0)
+    monkeypatch.setattr(Config, 'RESULT_CACHE_DISK_BYTES', 0)
+    monkeypatch.setattr(Config, 'COMPRESSION_MAX_WORKERS', 1)
+
+
+@pytest.fixture(scope='module')
+def scan():
+    """A grayscale gradient PNG written a row at a time, without holding its pixels"""
+    row = b'\x00' + bytes(x * 256 // SIZE for x in range(SIZE))
+    compressor = zlib.compressobj(1)
+    idat = b''.join(compressor.compress(row) for _ in range(SIZE)) + compressor.flush()
+    ihdr = struct.pack('>IIBBBBB', SIZE, SIZE, 8, 0, 0, 0, 0)
+    return PNG_SIGNATURE + _png_chunk(b'IHDR', ihdr) + _png_chunk(b'IDAT', idat) + _png_chunk(b'IEND', b'')
+
+
+@pytest.fixture
+def client():
+    from app import create_app
+    return create_app().test_client()
+
+
+def test_streamed_scan_is_admitted_and_compressed(scan, client):
+    assert SIZE * SIZE > Config.ADMISSION_MAX_IMAGE_PIXELS
+    response = client.post('/api/compress/image', data={'files': (io.BytesIO(scan), 'scan.png')})
+    data = response.get_data()
+    response.close()
+    assert response.status_code == 200
+    assert len(data) < len(scan)
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.size == (SIZE, SIZE)
+    assert admission._in_flight == 0
+
+
+def test_streamed_scan_is_charged_its_strips(scan):
+    from werkzeug.datastructures import FileStorage
+
+    cost = admission.estimate_cost('image', [FileStorage(io.BytesIO(scan), filename='scan.png')], streamed=True)
+    assert cost < SIZE * SIZE
+    assert cost <= Config.ADMISSION_MEMORY_BUDGET
+
+
+def test_scan_decoded_whole_is_rejected(scan, client):
+    # WebP output decodes the whole image
+    response = client.post('/api/compress/image', data={'files': (io.BytesIO(scan), 'scan.png'), 'format': 'webp'})
+    response.get_data()
+    response.close()
+    assert response.status_code == 413
@@ -0,0 +1,190 @@
+"""Tiled image processing must decode like the in-memory path.
+
+Every test runs with IMAGE_TILED_MIN_PIXELS at 0, so small images go
+through the strip code, and with strips of a few rows, so the bitstreams
+are spliced many times per image.
+
+Run from backend/: python -m pytest tests
+"""
+import io
+import zlib
+import struct
+import logging
+import pytest
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+from config.settings import Config
+from services.image_compression_service import ImageCompressionService
+from services.image_normalizer import ImageNormalizer
+from services.image_strips import PNG_SIGNATURE, ImageStrips, StripReader, _png_chunk
+from services.quality_predictor import QualityPredictor
+
+WIDTH, HEIGHT = 300, 250  # Not whole JPEG MCUs either way
+STRIP_ROWS = 32
+
+# Adam7 passes: (x start, y start, x step, y step)
+ADAM7 = [(0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4), (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2)]
+
+
+@pytest.fixture(autouse=True)
+def tiled(monkeypatch):
+    monkeypatch.setattr(Config, 'IMAGE_TILED_MIN_PIXELS', 0)
+    monkeypatch.setattr(Config, 'IMAGE_TILE_PIXELS', WIDTH * STRIP_ROWS)
+
+
+def _pixel(x, y):
+    # Smooth gradients with a little texture, so lossless PNG levels fit the size target
+    return ((x * 255 // WIDTH) ^ (y % 7), (y * 255 // HEIGHT), ((x + y) // 3) % 256)
+
+
+def _rgb():
+    image = Image.new('RGB', (WIDTH, HEIGHT))
+    image.putdata([_pixel(x, y) for y in range(HEIGHT) for x in range(WIDTH)])
+    return image
+
+
+def _raw_png(bit_depth=8, interlace=False):
+    """RGB PNG written by hand, Pillow writes neither 48-bit RGB nor interlaced PNGs"""
+    def sample(value):
+        return struct.pack('>H', value * 257) if bit_depth == 16 else bytes((value,))
+
+    def rows(x0, y0, dx, dy):
+        data = b''
+        for y in range(y0, HEIGHT, dy):
+            data += b'\x00' + b''.join(
+                sample(value) for x in range(x0, WIDTH, dx) for value in _pixel(x, y)
+            )
+        return data
+
+    passes = ADAM7 if interlace else [(0, 0, 1, 1)]
+    ihdr = struct.pack('>IIBBBBB', WIDTH, HEIGHT, bit_depth, 2, 0, 0, int(interlace))
+    return (
+        PNG_SIGNATURE + _png_chunk(b'IHDR', ihdr)
+        + _png_chunk(b'IDAT', zlib.compress(b''.join(rows(*adam7) for adam7 in passes)))
+        + _png_chunk(b'IEND', b'')
+    )
+
+
+def _save(image, **params):
+    output = io.BytesIO()
+    # Stored deflate keeps the original large, so the size target allows a lossless encode
+    image.save(output, 'PNG', compress_level=0, **params)
+    return output.getvalue()
+
+
+def _png_inputs():
+    rgb = _rgb()
+    alpha = Image.linear_gradient('L').resize((WIDTH, HEIGHT))
+    rgba = rgb.copy()
+    rgba.putalpha(alpha)
+    gray16 = rgb.convert('L').point(lambda value: value * 257, 'I').convert('I;16')
+    return {
+        'RGB': _save(rgb),
+        'RGBA': _save(rgba),
+        'L': _save(rgb.convert('L')),
+        'P': _save(rgb.quantize(colors=64)),
+        'I;16': _save(gray16),
+        'RGB;16': _raw_png(bit_depth=16),
+        'interlaced': _raw_png(interlace=True),
+    }
+
+
+PNG_INPUTS = _png_inputs()
+
+
+def _decoded(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def _assert_same_pixels(actual, expected):
+    assert actual.size == expected.size
+    assert actual.mode == expected.mode
+    if actual.mode == 'P':
+        # Palettes may be ordered differently, the colours must match
+        actual, expected = actual.convert('RGBA'), expected.convert('RGBA')
+    assert actual.tobytes() == expected.tobytes()
+
+
+def _compress(data, filename, monkeypatch, in_memory=False):
+    if in_memory:
+        monkeypatch.setattr(Config, 'IMAGE_TILED_MIN_PIXELS', WIDTH * HEIGHT)
+    output = ImageCompressionService._compress_image(FileStorage(io.BytesIO(data), filename=filename), 'balanced')
+    monkeypatch.setattr(Config, 'IMAGE_TILED_MIN_PIXELS', 0)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize('kind', sorted(PNG_INPUTS))
+def test_strip_reader_matches_whole_decode(kind):
+    data = PNG_INPUTS[kind]
+    reader = StripReader(Image.open(io.BytesIO(data)))
+    if kind in ('RGB', 'RGBA', 'L', 'P', 'I;16'):
+        assert reader.streamed
+    if kind == 'interlaced':
+        # Adam7 rows cannot be decoded a strip at a time
+        assert not reader.streamed
+
+    strips = list(reader.strips())
+    assert len(strips) == -(-HEIGHT // STRIP_ROWS)
+    _assert_same_pixels(ImageStrips.assemble(iter(strips), reader.size), _decoded(data))
+
+
+@pytest.mark.parametrize('kind', sorted(PNG_INPUTS))
+def test_encode_png_decodes_to_the_strips(kind):
+    image = ImageNormalizer.for_png(_decoded(PNG_INPUTS[kind]))
+    strips = ((top, image.crop((0, top, WIDTH, min(HEIGHT, top + STRIP_ROWS)))) for top in range(0, HEIGHT, STRIP_ROWS))
+    _assert_same_pixels(_decoded(ImageStrips.encode_png(strips, image.size, 6)), image)
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_encode_jpeg_decodes_like_one_encode(mode):
+    image = _rgb().convert(mode)
+    strips = ((top, image.crop((0, top, WIDTH, min(HEIGHT, top + STRIP_ROWS)))) for top in range(0, HEIGHT, STRIP_ROWS))
+    banded = _decoded(ImageStrips.encode_jpeg(strips, image.size, 75))
+    # Restart intervals do not change the coefficients, only the Huffman tables differ
+    _assert_same_pixels(banded, _decoded(QualityPredictor.encode(image, 'JPEG', 75, optimize=False)))
+
+
+@pytest.mark.parametrize('kind', sorted(PNG_INPUTS))
+def test_tiled_png_compression_decodes_like_in_memory(kind, monkeypatch):
+    data = PNG_INPUTS[kind]
+    tiled = _compress(data, 'input.png', monkeypatch)
+    in_memory = _compress(data, 'input.png', monkeypatch, in_memory=True)
+    assert len(tiled) < len(data)
+    _assert_same_pixels(_decoded(tiled), _decoded(in_memory))
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'L'])
+def test_tiled_jpeg_compression_decodes_like_in_memory(mode, monkeypatch):
+    output = io.BytesIO()
+    _rgb().convert(mode).save(output, 'JPEG', quality=95)
+    data = output.getvalue()
+    tiled = _compress(data, 'input.jpg', monkeypatch)
+    in_memory = _compress(data, 'input.jpg', monkeypatch, in_memory=True)
+    _assert_same_pixels(_decoded(tiled), _decoded(in_memory))
+
+
+def test_only_streamed_sources_get_banded_jpegs(monkeypatch):
+    # A PNG served as JPEG is streamed, so it is encoded in bands joined by restart markers
+    banded = _compress(PNG_INPUTS['RGB'], 'input.jpg', monkeypatch)
+    assert b'\xff\xdd' in banded  # DRI
+    assert _decoded(banded).size == (WIDTH, HEIGHT)
+
+    # JPEG and interlaced PNG sources are decoded whole anyway and keep optimized tables
+    output = io.BytesIO()
+    _rgb().save(output, 'JPEG', quality=95)
+    assert b'\xff\xdd' not in _compress(output.getvalue(), 'input.jpg', monkeypatch)
+    assert b'\xff\xdd' not in _compress(PNG_INPUTS['interlaced'], 'input.jpg', monkeypatch)
+
+
+def test_tiled_failure_logs_and_returns_original(monkeypatch, caplog):
+    def fail(*args, **kwargs):
+        raise ValueError('broken strip')
+
+    monkeypatch.setattr(ImageCompressionService, '_compress_tiled', staticmethod(fail))
+    data = PNG_INPUTS['RGB']
+    with caplog.at_level(logging.WARNING, logger='services.image_compression_service'):
+        assert _compress(data, 'input.png', monkeypatch) == data
+    record = next(record for record in caplog.records if record.levelno == logging.WARNING)
+    assert record.exc_info and 'broken strip' in str(record.exc_info[1])
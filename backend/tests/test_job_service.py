@@ -0,0 +1,84 @@
+"""Background jobs must never stay pending or leak admission budget.
+
+Run from backend/: python -m pytest tests
+"""
+import os
+import sys
+import time
+import subprocess
+import pytest
+from config.settings import Config
+from services.job_service import JobService
+from utils import admission
+
+
+@pytest.fixture(autouse=True)
+def job_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'JOB_FOLDER', str(tmp_path / 'jobs'))
+
+
+def _insert(job_id, status, owner_pid, created_at):
+    with JobService._connect() as connection:
+        connection.execute(
+            'INSERT INTO jobs (id, kind, status, created_at, owner_pid) VALUES (?, ?, ?, ?, ?)',
+            (job_id, 'image', status, created_at, owner_pid)
+        )
+
+
+def _exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_jobs_of_exited_processes_fail():
+    now = time.time()
+    _insert('orphan', 'running', _exited_pid(), now)
+    _insert('queued-orphan', 'queued', _exited_pid(), now)
+    _insert('live', 'running', os.getpid(), now)
+
+    JobService.expire()
+
+    assert JobService.get('orphan')['status'] == 'failed'
+    assert JobService.get('queued-orphan')['status'] == 'failed'
+    assert JobService.get('live')['status'] == 'running'
+
+
+def test_expiry_keeps_running_jobs():
+    old = time.time() - Config.JOB_RESULT_TTL - 60
+    _insert('old-running', 'running', os.getpid(), old)
+    _insert('old-done', 'done', None, old)
+
+    JobService.expire()
+
+    assert JobService.get('old-running')['status'] == 'running'
+    assert JobService.get('old-done') is None
+
+
+def test_failed_status_update_releases_the_budget(monkeypatch):
+    _insert('broken', 'queued', None, time.time())
+
+    def fail(job_id, **fields):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(JobService, '_update', staticmethod(fail))
+    JobService._run('broken', 'image', [], 1234)
+    assert admission._in_flight == 0
+
+
+def test_compression_jobs_use_the_request_options(monkeypatch):
+    from io import BytesIO
+    from PIL import Image
+    from werkzeug.datastructures import FileStorage
+
+    monkeypatch.setattr(Config, 'COMPRESSION_MAX_WORKERS', 1)
+    monkeypatch.setattr(Config, 'RESULT_CACHE_MEMORY_BYTES', 0)
+    monkeypatch.setattr(Config, 'RESULT_CACHE_DISK_BYTES', 0)
+    data = BytesIO()
+    Image.linear_gradient('L').convert('RGB').save(data, 'PNG', compress_level=0)
+
+    file = FileStorage(stream=BytesIO(data.getvalue()), filename='scan.png')
+    options = {'effort': 'fast', 'output_format': 'webp', 'quality': 50}
+    download_name, chunks = JobService._compress('image', [file], options)
+    assert download_name == 'compressed_scan.webp'
+    assert chunks[0][8:12] == b'WEBP'
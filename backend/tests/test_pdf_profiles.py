@@ -0,0 +1,79 @@
+"""PDF profiles must trade size for fidelity in order.
+
+Run from backend/: python -m pytest tests
+"""
+import io
+import random
+import fitz  # PyMuPDF
+import pytest
+from PIL import Image, ImageFilter
+from werkzeug.datastructures import FileStorage
+from config.settings import Config
+from services.pdf_compression_service import PdfCompressionService
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.setattr(Config, 'RESULT_CACHE_MEMORY_BYTES', 0)
+    monkeypatch.setattr(Config, 'RESULT_CACHE_DISK_BYTES', 0)
+    monkeypatch.setattr(Config, 'COMPRESSION_MAX_WORKERS', 1)
+
+
+def _photo(seed, size=(1200, 900), quality=95):
+    """A JPEG with photo-like detail"""
+    rng = random.Random(seed)
+    image = Image.new('RGB', (size[0] // 8, size[1] // 8))
+    image.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(image.width * image.height)])
+    image = image.resize(size, Image.Resampling.BICUBIC).filter(ImageFilter.DETAIL)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=quality)
+    return output.getvalue()
+
+
+def _pdf(dpi, quality=95):
+    """Pages each showing one 1200x900 photo at dpi"""
+    doc = fitz.open()
+    for seed in range(4):
+        page = doc.new_page(width=612, height=792)
+        width, height = 1200 / dpi * 72, 900 / dpi * 72
+        page.insert_image(fitz.Rect(36, 36, 36 + width, 36 + height), stream=_photo(seed, quality=quality))
+    return doc.tobytes()
+
+
+def _sizes(data):
+    return {
+        name: PdfCompressionService.compress_pdf(FileStorage(io.BytesIO(data), filename='doc.pdf'), profile=name).getbuffer().nbytes
+        for name in Config.PDF_PROFILES
+    }
+
+
+@pytest.mark.parametrize('dpi', [120, 200, 400])
+def test_profiles_are_ordered_by_size(dpi):
+    sizes = _sizes(_pdf(dpi))
+    assert sizes['screen'] <= sizes['ebook'] <= sizes['print']
+    if dpi > Config.PDF_PROFILES['ebook']['dpi']:
+        # Once ebook downsamples it must beat the full-resolution default
+        assert sizes['ebook'] <= sizes['standard']
+
+
+def test_images_needing_no_downsample_or_requality_are_kept():
+    data = _pdf(120, quality=35)
+    output = PdfCompressionService.compress_pdf(FileStorage(io.BytesIO(data), filename='doc.pdf'), profile='ebook')
+    with fitz.open(stream=data, filetype='pdf') as source, fitz.open(stream=output.getvalue(), filetype='pdf') as result:
+        streams = [source.xref_stream_raw(image[0]) for page in source for image in page.get_images()]
+        kept = [result.xref_stream_raw(image[0]) for page in result for image in page.get_images()]
+    assert kept == streams
+
+
+def test_cmyk_jpegs_decode_like_the_page_renders():
+    image = Image.merge('RGB', (Image.linear_gradient('L'), Image.linear_gradient('L').rotate(90), Image.new('L', (256, 256), 180)))
+    output = io.BytesIO()
+    image.convert('CMYK').save(output, 'JPEG', quality=95)
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_image(fitz.Rect(0, 0, 256, 256), stream=output.getvalue())
+    xref = page.get_images()[0][0]
+
+    decoded = PdfCompressionService._decode_image(doc, xref, doc.xref_stream_raw(xref))
+    rendered = page.get_pixmap(clip=fitz.Rect(0, 0, 256, 256))
+    assert decoded.tobytes() == rendered.samples
@@ -0,0 +1,185 @@
+import os
+import threading
+from functools import wraps
+from flask import jsonify, make_response, request
+from werkzeug.wsgi import ClosingIterator
+from config.settings import Config
+from utils import metrics
+from utils.worker_pool import disk_path
+
+_budget = threading.Condition()
+_in_flight = 0  # Estimated bytes of work currently admitted in this process
+
+# Bytes per pixel of decoded PDF images by colour space
+_COLORSPACE_BANDS = {'/DeviceGray': 1, '/CalGray': 1, '/DeviceCMYK': 4}
+
+class AdmissionError(Exception):
+    """Raised when a request cannot be admitted, carrying the HTTP status"""
+
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def _image_cost(file, streamed=False):
+    """Decoded bytes of one uploaded image, read from its header only.
+
+    With streamed, PNGs the compressor reads in strips are charged their
+    strip working set and admitted up to ADMISSION_MAX_STREAMED_PIXELS.
+    """
+    from PIL import Image
+    # Also raises Pillow's bomb guard to ADMISSION_MAX_STREAMED_PIXELS
+    from services.image_strips import ImageStrips, StripReader, strip_rows
+
+    try:
+        with Image.open(file.stream) as image:
+            width, height = image.size
+            bands = len(image.getbands())
+            streamed = streamed and ImageStrips.can_tile(image) and StripReader(image).streamed
+    except Image.DecompressionBombError:
+        raise AdmissionError(f'{file.filename} has too many pixels', 413)
+    except Exception:
+        # Not an image, the route reports it
+        return 0
+    finally:
+        file.stream.seek(0)
+
+    max_pixels = Config.ADMISSION_MAX_STREAMED_PIXELS if streamed else Config.ADMISSION_MAX_IMAGE_PIXELS
+    if width * height > max_pixels:
+        raise AdmissionError(f'{file.filename} has too many pixels ({width}x{height})', 413)
+    # Grayscale and palette images are usually converted to RGB before encoding
+    bands = max(bands, 3)
+    if not streamed:
+        return width * height * bands * Config.ADMISSION_IMAGE_COPIES
+
+    from services.image_compression_service import ImageCompressionService
+
+    # Copies of a strip, the largest downscaled level finished in memory, and the
+    # output, which is only kept when smaller than the upload
+    file_bytes = file.stream.seek(0, os.SEEK_END)
+    file.stream.seek(0)
+    max_dimension = max(dimension for dimension, _ in ImageCompressionService.PNG_LEVELS if dimension)
+    working_pixels = strip_rows(width) * width + max_dimension * max_dimension
+    return working_pixels * bands * Config.ADMISSION_IMAGE_COPIES + 2 * file_bytes
+
+def _pdf_cost(file):
+    """Decoded bytes of the images the PDF workers hold at once, from the xref table"""
+    import fitz  # PyMuPDF
+
+    path = disk_path(file)
+    try:
+        if path is not None:
+            # Spooled uploads are opened in place rather than read into memory
+            doc = fitz.open(path)
+            size = os.path.getsize(path)
+        else:
+            data = file.stream.read()
+            file.stream.seek(0)
+            doc = fitz.open(stream=data, filetype='pdf')
+            size = len(data)
+    except Exception:
+        return 0
+
+    try:
+        if doc.page_count > Config.ADMISSION_MAX_PDF_PAGES:
+            raise AdmissionError(f'{file.filename} has too many pages ({doc.page_count})', 413)
+
+        image_costs = {}
+        for page in doc:
+            for img in page.get_images():
+                xref, width, height = img[0], img[2], img[3]
+                if width * height > Config.ADMISSION_MAX_IMAGE_PIXELS:
+                    raise AdmissionError(f'{file.filename} contains an image with too many pixels', 413)
+                bands = _COLORSPACE_BANDS.get(img[5], 3)
+                image_costs[xref] = width * height * bands * Config.ADMISSION_IMAGE_COPIES
+    finally:
+        doc.close()
+
+    # Each PDF worker holds one image at a time, plus the document itself
+    largest = sorted(image_costs.values(), reverse=True)[:max(1, Config.PDF_WORKERS)]
+    return sum(largest) + size
+
+def estimate_cost(kind, files, streamed=False):
+    """Estimate the peak memory in bytes a request of this kind will need.
+
+    Only headers and PDF object tables are read. streamed is set when the
+    images are compressed to JPEG or PNG, which reads large PNGs in strips.
+    Raises AdmissionError (413) when a single input exceeds the hard limits.
+    """
+    files = [file for file in files if file.filename]
+    if kind == 'pdf':
+        costs = [_pdf_cost(file) for file in files]
+    else:
+        costs = [_image_cost(file, streamed) for file in files]
+    if not costs:
+        return 0
+
+    if kind == 'jpg-to-pdf':
+        # Pages are converted one at a time
+        return max(costs)
+    # Batch members run up to the per-request concurrency at once
+    return sum(sorted(costs, reverse=True)[:max(1, Config.COMPRESSION_REQUEST_CONCURRENCY)])
+
+def acquire(cost, timeout=None):
+    """Reserve cost bytes of the in-flight budget, waiting up to timeout seconds.
+
+    A request larger than the whole budget is only admitted when nothing
+    else is running. Raises AdmissionError (429) when the wait times out.
+    """
+    global _in_flight
+    with _budget:
+        admitted = _budget.wait_for(
+            lambda: _in_flight == 0 or _in_flight + cost <= Config.ADMISSION_MEMORY_BUDGET,
+            timeout=timeout
+        )
+        if not admitted:
+            metrics.increment('yukomp_admission_rejected_total', reason='busy')
+            raise AdmissionError('Server is busy, please retry shortly', 429, retry_after=Config.ADMISSION_RETRY_AFTER)
+        _in_flight += cost
+
+def release(cost):
+    """Return cost bytes to the in-flight budget"""
+    global _in_flight
+    with _budget:
+        _in_flight -= cost
+        _budget.notify_all()
+
+def admission_controlled(kind, streamed=False):
+    """Route decorator that admits a request against the decoded-pixel budget.
+
+    streamed marks routes that compress images with ImageCompressionService,
+    reading large PNGs in strips unless another output format is requested.
+    The reservation is held until the response, including a streamed one,
+    is closed.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method == 'OPTIONS' or 'files' not in request.files:
+                return view(*args, **kwargs)
+
+            try:
+                # WebP and AVIF output decodes the whole image
+                cost = estimate_cost(kind, request.files.getlist('files'), streamed and not request.form.get('format'))
+                acquire(cost, timeout=Config.ADMISSION_QUEUE_TIMEOUT)
+            except AdmissionError as e:
+                if e.status_code == 413:
+                    metrics.increment('yukomp_admission_rejected_total', reason='too_large')
+                response = make_response(jsonify({'error': 'Request not admitted', 'message': str(e)}), e.status_code)
+                if e.retry_after:
+                    response.headers['Retry-After'] = str(e.retry_after)
+                return response
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                release(cost)
+                raise
+            if response.direct_passthrough:
+                # send_file responses skip call_on_close, so release when their iterable closes
+                response.response = ClosingIterator(response.response, lambda: release(cost))
+            else:
+                response.call_on_close(lambda: release(cost))
+            return response
+        return wrapper
+    return decorator
@@ -12,4 +12,32 @@ def secure_file_name(filename):
 
 def get_file_extension(filename):
     """Get file extension from filename"""
-    return filename.rsplit('.', 1)[1].lower() if '.' in filename else None 
\ No newline at end of file
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else None
+
+# Mimetypes of the image formats the services write
+IMAGE_MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+
+def image_extension(data):
+    """Return the extension of encoded image bytes from their signature, or None"""
+    header = bytes(data[:12])
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[4:8] == b'ftyp' and header[8:12] in (b'avif', b'avis'):
+        return 'avif'
+    return None
+
+def with_image_extension(filename, extension):
+    """Swap the extension of filename for extension, unless it already names that format"""
+    if extension is None or IMAGE_MIMETYPES.get(get_file_extension(filename)) == IMAGE_MIMETYPES[extension]:
+        return filename
+    return f"{filename.rsplit('.', 1)[0]}.{extension}"
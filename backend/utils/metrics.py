@@ -0,0 +1,116 @@
+import time
+import threading
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(10))  # 1 KB .. 256 MB
+COUNT_BUCKETS = (1, 2, 3, 4, 5, 10)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'yukomp_stage_seconds': ('histogram', 'Time spent in each processing stage', SECONDS_BUCKETS),
+    'yukomp_image_encode_attempts': ('histogram', 'Full-resolution encodes per compressed image', COUNT_BUCKETS),
+    'yukomp_input_bytes': ('histogram', 'Size of each input file', BYTES_BUCKETS),
+    'yukomp_output_bytes': ('histogram', 'Size of each output file', BYTES_BUCKETS),
+    'yukomp_bytes_in_total': ('counter', 'Input bytes processed', None),
+    'yukomp_bytes_out_total': ('counter', 'Output bytes produced', None),
+    'yukomp_result_cache_events_total': ('counter', 'Result cache hits, misses, stores and evictions', None),
+    'yukomp_failures_total': ('counter', 'Failures by processing stage', None),
+    'yukomp_admission_rejected_total': ('counter', 'Requests rejected by admission control', None),
+}
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, value=1, **labels):
+    """Add value to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, **labels):
+    """Record one histogram observation"""
+    buckets = METRICS[name][2]
+    key = _key(name, labels)
+    with _lock:
+        series = _histograms.get(key)
+        if series is None:
+            series = _histograms[key] = [0] * (len(buckets) + 2)
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+@contextmanager
+def timer(stage):
+    """Time a block as a stage, counting it as a failure if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        increment('yukomp_failures_total', stage=stage)
+        raise
+    finally:
+        observe('yukomp_stage_seconds', time.perf_counter() - start, stage=stage)
+
+def record_transfer(service, bytes_in, bytes_out):
+    """Count the input and output sizes of one processed file"""
+    increment('yukomp_bytes_in_total', bytes_in, service=service)
+    increment('yukomp_bytes_out_total', bytes_out, service=service)
+    observe('yukomp_input_bytes', bytes_in, service=service)
+    observe('yukomp_output_bytes', bytes_out, service=service)
+
+def drain():
+    """Return everything recorded so far and reset, for shipping out of a worker process"""
+    global _counters, _histograms
+    with _lock:
+        snapshot = (_counters, _histograms)
+        _counters, _histograms = {}, {}
+    return snapshot
+
+def merge(snapshot):
+    """Add a snapshot from drain() into this process"""
+    counters, histograms = snapshot
+    with _lock:
+        for key, value in counters.items():
+            _counters[key] = _counters.get(key, 0) + value
+        for key, values in histograms.items():
+            series = _histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                series[index] += value
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(values) for key, values in _histograms.items()}
+
+    lines = []
+    for name, (metric_type, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'counter':
+            for (series_name, labels), value in sorted(counters.items()):
+                if series_name == name:
+                    lines.append(f'{name}{_format_labels(labels)} {value}')
+        else:
+            for (series_name, labels), values in sorted(histograms.items()):
+                if series_name != name:
+                    continue
+                for bound, count in zip(buckets, values):
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {values[-2]}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]}')
+                lines.append(f'{name}_count{_format_labels(labels)} {values[-2]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,55 @@
+import time
+import threading
+from io import BytesIO
+
+# Readiness of this process, reported by the health routes
+_state = {'ready': False, 'seconds': None, 'error': None}
+_thread = None
+
+def warm_up():
+    """Load the codec libraries and exercise each encoder once.
+
+    Called before the server forks workers (WARM_UP=preload) so the
+    imports and codec initialisation are shared, or from start_background.
+    Either way they are not paid on the first request.
+    """
+    start = time.perf_counter()
+    try:
+        import fitz  # PyMuPDF
+        from PIL import Image
+        import services.image_compression_service  # noqa: F401
+        import services.pdf_compression_service  # noqa: F401
+        import services.pdf_conversion_service  # noqa: F401
+
+        # Register every Pillow plugin and round-trip the formats we serve
+        Image.init()
+        image = Image.new('RGB', (16, 16), (255, 255, 255))
+        for image_format in ('JPEG', 'PNG'):
+            buffer = BytesIO()
+            image.save(buffer, format=image_format)
+            Image.open(BytesIO(buffer.getvalue())).load()
+
+        # Build a one-page PDF so MuPDF is fully initialised
+        doc = fitz.open()
+        doc.new_page()
+        doc.tobytes()
+        doc.close()
+
+        _state.update(ready=True, error=None)
+    except Exception as e:
+        _state.update(ready=False, error=str(e))
+    finally:
+        _state['seconds'] = round(time.perf_counter() - start, 3)
+    return _state['ready']
+
+def start_background():
+    """Run warm_up in a daemon thread, the app answers health checks meanwhile"""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+        _thread.start()
+    return _thread
+
+def status():
+    """Return a copy of this process's warm-up state"""
+    return dict(_state)
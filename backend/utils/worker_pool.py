@@ -0,0 +1,104 @@
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from werkzeug.datastructures import FileStorage
+from config.settings import Config
+from utils import metrics
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_worker = False
+
+# Imported once in the fork server, so every worker forks with the codecs loaded
+PRELOAD_MODULES = [
+    'services.image_compression_service',
+    'services.pdf_compression_service',
+    'services.pdf_conversion_service',
+]
+
+def _mark_worker():
+    """Pool initializer, flags the process so it never starts a nested pool"""
+    global _in_worker
+    _in_worker = True
+
+def get_executor():
+    """Return this process's compression pool, or None when disabled.
+
+    Each server process has its own pool of COMPRESSION_MAX_WORKERS.
+    """
+    global _executor
+    if Config.COMPRESSION_MAX_WORKERS <= 1 or _in_worker:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            # Workers fork from a single-threaded fork server, never from this
+            # process, whose request threads may hold locks mid-fork
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(PRELOAD_MODULES)
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.COMPRESSION_MAX_WORKERS,
+                mp_context=context,
+                initializer=_mark_worker
+            )
+    return _executor
+
+def disk_path(file):
+    """Return the path of a file-backed upload, or None for in-memory and anonymous temp files"""
+    path = getattr(file.stream, 'name', None)
+    if isinstance(path, str) and os.path.isfile(path):
+        return path
+    return None
+
+def _payload(file):
+    # Files already on disk are sent by path so large inputs are not copied through the pipe
+    return disk_path(file) or file.read()
+
+def run_task(task, filename, payload, options):
+    """Worker entry point, returns the output bytes and the metrics recorded for them"""
+    stream = open(payload, 'rb') if isinstance(payload, str) else BytesIO(payload)
+    with stream:
+        file = FileStorage(stream=stream, filename=filename)
+        return task(file, **options).getvalue(), metrics.drain()
+
+def collect(future):
+    """Wait for a pool result, merging its metrics into this process"""
+    result, snapshot = future.result()
+    metrics.merge(snapshot)
+    return result
+
+def run(task, file, **options):
+    """Run task on one uploaded file in the pool, or inline when the pool is disabled"""
+    executor = get_executor()
+    if executor is None:
+        return task(file, **options).getvalue()
+    return collect(executor.submit(run_task, task, file.filename, _payload(file), options))
+
+def imap_ordered(task, files, max_concurrency=None, **options):
+    """Run task over uploaded files in worker processes, yielding results in order.
+
+    At most max_concurrency files of one request are in flight at a time so a
+    single batch cannot fill the shared pool ahead of other requests. Keyword
+    options are passed on to every task call.
+    """
+    max_concurrency = max(1, max_concurrency or Config.COMPRESSION_REQUEST_CONCURRENCY)
+    executor = get_executor()
+    if executor is None:
+        for file in files:
+            yield task(file, **options).getvalue()
+        return
+
+    pending = deque()
+    try:
+        for file in files:
+            pending.append(executor.submit(run_task, task, file.filename, _payload(file), options))
+            if len(pending) >= max_concurrency:
+                yield collect(pending.popleft())
+        while pending:
+            yield collect(pending.popleft())
+    finally:
+        # Drop queued work if the caller stopped early or a task failed
+        for future in pending:
+            future.cancel()
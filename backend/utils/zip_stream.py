@@ -0,0 +1,45 @@
+import io
+import time
+import zipfile
+from config.settings import Config
+from utils import metrics
+from utils.file_utils import get_file_extension
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable sink that collects bytes until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(members):
+    """Yield a zip archive chunk by chunk from (name, data) pairs.
+
+    Each member is emitted as soon as it is available, so only one member is
+    held at a time. Already-compressed formats are stored instead of deflated.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for name, data in members:
+            zip_info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            if get_file_extension(name) in Config.ZIP_STORED_EXTENSIONS:
+                zip_info.compress_type = zipfile.ZIP_STORED
+            else:
+                zip_info.compress_type = zipfile.ZIP_DEFLATED
+            with metrics.timer('zip_assembly'):
+                zip_file.writestr(zip_info, data)
+            yield sink.drain()
+    # Central directory is written on close
+    yield sink.drain()
@@ -0,0 +1,10 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app"""
+from app import create_app
+from config.settings import Config
+from utils.warmup import warm_up
+
+# Runs once in the master when preload_app is on, workers inherit the warm state.
+# With WARM_UP=background each worker warms up after fork instead (gunicorn.conf.py).
+if Config.WARM_UP == 'preload':
+    warm_up()
+app = create_app()